@@ -1,22 +1,35 @@
 import os
+import functools
+import hashlib
+import shutil
+import heapq
+import mmap
 import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
 import re
 import json
+from collections import deque, OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Union, Any
+from typing import Dict, List, Optional, Set, Union, Any
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, BotCommand, BotCommandScopeAllPrivateChats, BotCommandScopeChat
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    PicklePersistence,
     ContextTypes,
     filters,
     ConversationHandler
 )
 import asyncio
 from telegram.constants import ParseMode
+from telegram.request import HTTPXRequest
+from telegram.helpers import escape_markdown
 import time
 
 # Try to import psutil for better uptime info, but it's optional
@@ -26,6 +39,21 @@ try:
 except ImportError:
     HAS_PSUTIL = False
 
+# Try to import orjson for faster data serialization, but it's optional
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# Try to import uvloop for a faster event loop, but it's optional
+# (not available on Windows)
+try:
+    import uvloop
+    HAS_UVLOOP = True
+except ImportError:
+    HAS_UVLOOP = False
+
 # Load environment variables
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -37,17 +65,35 @@ RAILWAY_STATIC_URL = os.getenv("RAILWAY_STATIC_URL")
 # Session management settings
 SESSION_TIMEOUT = timedelta(minutes=int(os.getenv("SESSION_TIMEOUT", "15")))  # Normal session timeout (15 min default)
 EXTENDED_SESSION_TIMEOUT = timedelta(minutes=int(os.getenv("EXTENDED_SESSION_TIMEOUT", "1440")))  # Extended session timeout (24 hours default)
+SESSION_TIMEOUT_SEC = SESSION_TIMEOUT.total_seconds()
+EXTENDED_SESSION_TIMEOUT_SEC = EXTENDED_SESSION_TIMEOUT.total_seconds()
+STD_SESSION_MIN = int(SESSION_TIMEOUT_SEC / 60)
+EXT_SESSION_MIN = int(EXTENDED_SESSION_TIMEOUT_SEC / 60)
 
 # Data storage
 DATA_FILE = "bot_data.json"
+ACTIVITY_LOG = "activity.log"
+COMMANDS_HASH_FILE = ".commands_hash"  # Skips re-registering an unchanged command menu
+CHECKPOINT_INTERVAL = 60  # Seconds between folding the activity log into the data file
 BACKUP_DIR = "backups"
+PERSISTENCE_FILE = "ptb_state.pkl"  # PTB conversation/user_data state across restarts
 os.makedirs(BACKUP_DIR, exist_ok=True)
 
-# Set up logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", 
-    level=logging.INFO
+# Set up logging through a queue so handlers never block the event loop
+# on a synchronous stream write; a listener thread does the actual I/O
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_output = logging.StreamHandler()
+_log_output.setFormatter(
+    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 )
+_log_listener = QueueListener(_log_queue, _log_output)
+_log_listener.start()
+# Attach the queue handler directly; basicConfig would give it a default
+# formatter and QueueHandler.prepare() would then pre-format each record,
+# double-prefixing every line once the listener formats it again
+_root_logger = logging.getLogger()
+_root_logger.addHandler(QueueHandler(_log_queue))
+_root_logger.setLevel(logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Conversation states
@@ -55,35 +101,129 @@ AUTHENTICATE = 0
 AWAITING_AUTH_REPLY = 1
 SESSION_SELECTION = 2
 
+class AsyncTokenBucket:
+    """Token-bucket limiter for outgoing Bot API calls.
+
+    Fan-out paths (broadcast, clearall, batched deletes) can easily exceed
+    Telegram's ~30 msg/s cap and spend their time in 429 retries; acquiring
+    a token before each send shapes the burst to the allowed envelope."""
+
+    def __init__(self, rate: float, per: float = 1.0):
+        self.rate = rate
+        self.per = per
+        self.tokens = rate
+        self.last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate / self.per)
+            self.last = now
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+                # The refill accrued during the sleep pays for this call;
+                # advance the clock so the next caller isn't credited the
+                # same interval again
+                self.last = time.monotonic()
+                self.tokens = 0
+            else:
+                self.tokens -= 1
+
+# Shared limiter for bulk sends; stays under Telegram's global message cap
+send_bucket = AsyncTokenBucket(rate=25)
+
 # Data structures
 class BotData:
     def __init__(self):
-        self.authenticated_users: Dict[str, Dict[str, Any]] = {}
-        self.blocked_users: List[int] = []
+        self.authenticated_users: Dict[int, Dict[str, Any]] = {}
+        self.blocked_users: Set[int] = set()
         self.security_questions: Dict[str, str] = {
             "What's your secret phrase?": "277353"  # Set to the provided secret answer
         }
+        self._recipient_ids: Set[int] = set()  # Non-admin users eligible for broadcasts
+        self._expiry_heap: List[tuple] = []  # (expiry_ts, user_id) pairs for the sweeper
+        self._refresh_auth_cache()
+        self._wal = None  # Append-only activity log, opened on first write
+        self._wal_dirty = False
+        self._wal_seq = 0  # Bumped per append; guards checkpoint truncation
+        # Saves run from worker threads while the loop thread appends to
+        # the WAL; one reentrant lock serializes every persistence path
+        self._persist_lock = threading.RLock()
+        self._active_cache: Optional[int] = None  # Cached valid-session count
+        self._active_cache_ts = 0.0
+        # Chats where delete_chat_history is known to work (or not); saves
+        # a doomed round-trip per ineligible user on every cleanup
+        self._delete_history_capable: Dict[int, bool] = {}
         self.last_backup = datetime.now()
         self.start_time = datetime.now()  # Initialize start time for uptime calculation
+        # Track the last 5 backup filenames so rotation doesn't rescan the
+        # directory, plus a running count of all backup files for /status
+        with os.scandir(BACKUP_DIR) as entries:
+            names = [e.name for e in entries if e.name.endswith(".json")]
+        existing = sorted(n for n in names if n.startswith("bot_data_backup_"))
+        self._recent_backups: deque = deque(existing[-5:], maxlen=5)
+        self._backup_count = sum(1 for n in names if n.startswith("bot_data_"))
         
+    def _refresh_auth_cache(self):
+        """Cache the primary question/answer so handlers don't rebuild them per request"""
+        self.auth_question, answer = next(iter(self.security_questions.items()))
+        self._auth_answer_lower = answer.lower()
+
+    def active_session_count(self) -> int:
+        """Count currently valid sessions, cached briefly for /status."""
+        now_ts = time.time()
+        if self._active_cache is None or now_ts - self._active_cache_ts > 30:
+            self._active_cache = sum(
+                1 for uid in self.authenticated_users if self.is_session_valid(uid)
+            )
+            self._active_cache_ts = now_ts
+        return self._active_cache
+
+    def _serialize(self) -> bytes:
+        """Snapshot the current state as the on-disk blob.
+
+        Must run on the event-loop thread (or before the loop starts) so
+        the dict iteration never races handler mutations."""
+        # Membership may have changed; recount on the next /status
+        self._active_cache = None
+        payload = {
+            'authenticated_users': {str(uid): data for uid, data in self.authenticated_users.items()},
+            'blocked_users': list(self.blocked_users),
+            'security_questions': self.security_questions
+        }
+        if HAS_ORJSON:
+            return orjson.dumps(payload)
+        return json.dumps(payload, separators=(',', ':')).encode()
+
+    def _write_blob(self, blob: bytes):
+        """Write a prebuilt blob to the data file; safe from any thread"""
+        with self._persist_lock:
+            try:
+                # Create a backup if needed (every 24 hours)
+                now = datetime.now()
+                if (now - self.last_backup).total_seconds() > 86400:  # 24 hours
+                    self.create_backup()
+                    self.last_backup = now
+
+                # Single write to a temp file, then atomic rename so readers
+                # never observe a torn data file
+                tmp_file = DATA_FILE + ".tmp"
+                with open(tmp_file, 'wb') as f:
+                    f.write(blob)
+                os.replace(tmp_file, DATA_FILE)
+                logger.info("Bot data saved successfully")
+            except Exception as e:
+                logger.error("Error saving bot data: %s", e)
+
     def save_to_file(self):
-        """Save bot data to file"""
-        try:
-            # Create a backup if needed (every 24 hours)
-            now = datetime.now()
-            if (now - self.last_backup).total_seconds() > 86400:  # 24 hours
-                self.create_backup()
-                self.last_backup = now
-                
-            with open(DATA_FILE, 'w') as f:
-                json.dump({
-                    'authenticated_users': self.authenticated_users,
-                    'blocked_users': self.blocked_users,
-                    'security_questions': self.security_questions
-                }, f, indent=2)
-            logger.info("Bot data saved successfully")
-        except Exception as e:
-            logger.error(f"Error saving bot data: {e}")
+        """Save bot data to file (synchronous; startup and fallback paths)"""
+        self._write_blob(self._serialize())
+
+    async def save_to_file_async(self):
+        """Snapshot on the loop thread, then write from a worker thread"""
+        blob = self._serialize()
+        await asyncio.to_thread(self._write_blob, blob)
     
     def create_backup(self):
         """Create a backup of the data file"""
@@ -94,87 +234,261 @@ class BotData:
             # Create backup file with timestamp
             backup_file = f"{BACKUP_DIR}/bot_data_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
             
-            # Copy the current data to backup
-            with open(DATA_FILE, 'r') as src, open(backup_file, 'w') as dst:
-                dst.write(src.read())
+            # Copy the current data to backup (kernel-side copy, no userspace buffer)
+            shutil.copyfile(DATA_FILE, backup_file)
                 
-            # Keep only last 5 backups
-            backups = sorted([f for f in os.listdir(BACKUP_DIR) if f.startswith("bot_data_backup_")])
-            if len(backups) > 5:
-                for old_backup in backups[:-5]:
-                    os.remove(os.path.join(BACKUP_DIR, old_backup))
-                    
-            logger.info(f"Created backup: {backup_file}")
+            # Keep only last 5 backups, tracked in memory instead of re-listing the directory
+            self._backup_count += 1
+            if len(self._recent_backups) == self._recent_backups.maxlen:
+                try:
+                    os.remove(os.path.join(BACKUP_DIR, self._recent_backups[0]))
+                    self._backup_count -= 1
+                except OSError:
+                    pass
+            self._recent_backups.append(os.path.basename(backup_file))
+
+            logger.info("Created backup: %s", backup_file)
         except Exception as e:
-            logger.error(f"Error creating backup: {e}")
+            logger.error("Error creating backup: %s", e)
     
+    def _append_activity(self, user_id: int, activity_ts: float):
+        """Append one activity record to the write-ahead log"""
+        try:
+            if self._wal is None:
+                self._wal = open(ACTIVITY_LOG, "ab", buffering=0)
+            record = {"u": user_id, "t": activity_ts}
+            blob = orjson.dumps(record) if HAS_ORJSON else json.dumps(record).encode()
+            with self._persist_lock:
+                self._wal.write(blob + b"\n")
+                self._wal_dirty = True
+                self._wal_seq += 1
+        except Exception as e:
+            logger.error("Error writing activity log: %s", e)
+            # Fall back to a full save so the activity isn't lost
+            self.save_to_file()
+
+    def _replay_activity_log(self):
+        """Merge activity records left over from a previous run"""
+        try:
+            if not os.path.exists(ACTIVITY_LOG):
+                return
+            with open(ACTIVITY_LOG, "rb") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    record = orjson.loads(line) if HAS_ORJSON else json.loads(line)
+                    user_data = self.authenticated_users.get(int(record.get("u")))
+                    if user_data:
+                        user_data["last_activity"] = record.get("t")
+        except Exception as e:
+            logger.error("Error replaying activity log: %s", e)
+
+    def mark_dirty(self):
+        """Defer persistence to the next checkpoint instead of saving inline"""
+        self._wal_dirty = True
+        self._active_cache = None
+
+    async def checkpoint(self):
+        """Fold pending activity records into the data file and truncate the log"""
+        if not self._wal_dirty:
+            return
+        # Snapshot on the loop thread; the worker only truncates the log
+        # when no record was appended after the snapshot, so nothing can
+        # land in the save/truncate window and be discarded
+        blob = self._serialize()
+        seq = self._wal_seq
+        await asyncio.to_thread(self._checkpoint_write, blob, seq)
+
+    def _checkpoint_write(self, blob: bytes, seq: int):
+        """Write a checkpoint blob and truncate the WAL it covers"""
+        with self._persist_lock:
+            self._write_blob(blob)
+            try:
+                if self._wal is not None and self._wal_seq == seq:
+                    self._wal.truncate(0)
+                    self._wal_dirty = False
+            except Exception as e:
+                logger.error("Error truncating activity log: %s", e)
+
     def load_from_file(self):
         """Load bot data from file"""
         try:
             if os.path.exists(DATA_FILE):
-                with open(DATA_FILE, 'r') as f:
-                    data = json.load(f)
-                    self.authenticated_users = data.get('authenticated_users', {})
-                    self.blocked_users = data.get('blocked_users', [])
-                    self.security_questions = data.get('security_questions', 
-                                                      {"What's your secret phrase?": "277353"})
+                with open(DATA_FILE, 'rb') as f:
+                    if HAS_ORJSON and os.path.getsize(DATA_FILE) > 0:
+                        # Parse straight out of the page cache without an
+                        # intermediate bytes object sized to the whole file
+                        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        try:
+                            data = orjson.loads(memoryview(mapped))
+                        finally:
+                            mapped.close()
+                    else:
+                        raw = f.read()
+                        data = orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
+                self.authenticated_users = {int(uid): user_data for uid, user_data
+                                            in data.get('authenticated_users', {}).items()}
+                # Migrate legacy ISO-8601 timestamps to epoch floats
+                for user_data in self.authenticated_users.values():
+                    for field in ("authenticated_at", "last_activity", "expiry_time"):
+                        value = user_data.get(field)
+                        if isinstance(value, str):
+                            try:
+                                user_data[field] = datetime.fromisoformat(value).timestamp()
+                            except ValueError:
+                                user_data.pop(field, None)
+                self.blocked_users = set(data.get('blocked_users', []))
+                self.security_questions = data.get('security_questions',
+                                                  {"What's your secret phrase?": "277353"})
+                self._recipient_ids = {uid for uid in self.authenticated_users
+                                       if uid != ADMIN_ID}
+                for uid, user_data in self.authenticated_users.items():
+                    expiry = user_data.get("expiry_time")
+                    if isinstance(expiry, (int, float)):
+                        heapq.heappush(self._expiry_heap, (expiry, uid))
+                self._refresh_auth_cache()
+                self._replay_activity_log()
                 logger.info("Bot data loaded successfully")
             else:
                 logger.info("No existing data file found, using defaults")
         except Exception as e:
-            logger.error(f"Error loading bot data: {e}")
-            
-    def is_session_valid(self, user_id: int) -> bool:
-        """Check if a user's session is valid and not expired"""
-        user_id_str = str(user_id)
-        
-        # Admin always has a valid session
-        if user_id == ADMIN_ID:
-            return True
-            
-        if user_id_str not in self.authenticated_users:
-            return False
+            logger.error("Error loading bot data: %s", e)
             
-        user_data = self.authenticated_users[user_id_str]
-        last_activity = user_data.get("last_activity", "")
+    def get_valid_session(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Return the user's session record if it is still valid, else None."""
+        user_data = self.authenticated_users.get(user_id)
+        if user_data is None:
+            return None
+
+        last_activity = user_data.get("last_activity")
         session_type = user_data.get("session_type", "standard")
-        
+
         if not last_activity:
-            return False
-            
+            return None
+
         try:
-            # Calculate expiration based on session type
-            last_active = datetime.fromisoformat(last_activity)
-            current_time = datetime.now()
-            
-            # Get the appropriate timeout based on session type
-            if session_type == "extended":
-                timeout_minutes = EXTENDED_SESSION_TIMEOUT.total_seconds() / 60
-            else:
-                timeout_minutes = SESSION_TIMEOUT.total_seconds() / 60
-                
-            # Check if expired
-            time_diff = (current_time - last_active).total_seconds() / 60
-            if time_diff > timeout_minutes:
-                logger.info(f"Session expired for user {user_id} after {time_diff:.1f} minutes (timeout: {timeout_minutes})")
-                return False
-                
-            return True
+            # Use the timeout stored with the session; fall back to the
+            # configured defaults for records written by older versions
+            timeout_seconds = user_data.get("session_timeout")
+            if timeout_seconds is None:
+                if session_type == "extended":
+                    timeout_seconds = EXTENDED_SESSION_TIMEOUT_SEC
+                else:
+                    timeout_seconds = SESSION_TIMEOUT_SEC
+
+            # Single comparison against the absolute expiry instant
+            if time.time() > last_activity + timeout_seconds:
+                age_minutes = (time.time() - last_activity) / 60
+                logger.info("Session expired for user %s after %.1f minutes (timeout: %.0f)", user_id, age_minutes, timeout_seconds / 60)
+                return None
+
+            return user_data
         except Exception as e:
-            logger.error(f"Error checking session expiration: {e}")
-            return False
+            logger.error("Error checking session expiration: %s", e)
+            return None
 
-    def update_activity(self, user_id: int):
+    def is_session_valid(self, user_id: int) -> bool:
+        """Check if a user's session is valid and not expired"""
+        # Admin always has a valid session; check before any record lookup
+        if user_id == ADMIN_ID:
+            return True
+
+        return self.get_valid_session(user_id) is not None
+
+    def update_activity(self, user_id: int, record: Optional[Dict[str, Any]] = None):
         """Update the last activity timestamp for a user"""
-        user_id_str = str(user_id)
-        if user_id_str in self.authenticated_users:
-            self.authenticated_users[user_id_str]["last_activity"] = datetime.now().isoformat()
-            self.save_to_file()
+        if record is None:
+            record = self.authenticated_users.get(user_id)
+        if record is not None:
+            now_ts = time.time()
+            record["last_activity"] = now_ts
+            # Append a tiny log record instead of rewriting the whole data file
+            self._append_activity(user_id, now_ts)
 
 # Initialize bot data
 bot_data = BotData()
 bot_data.load_from_file()
 
+# Static keyboards, built once; InlineKeyboardMarkup is immutable so the
+# instances are safe to reuse across requests
+SESSION_TYPE_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("Standard Session (15 min)", callback_data="session_standard"),
+        InlineKeyboardButton("Extended Session (24h)", callback_data="session_extended")
+    ]
+])
+
+CLEARALL_CONFIRM_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Yes, clear all", callback_data="confirm_clearall")],
+    [InlineKeyboardButton("Cancel", callback_data="cancel_clearall")]
+])
+
+@functools.lru_cache(maxsize=8)
+def _group_link_prefix(group_id) -> str:
+    """t.me deep-link prefix for a group, with the -100 prefix stripped.
+
+    Cached because the group id only changes on /setup_group."""
+    gid_s = str(group_id)
+    clean_group_id = gid_s[4:] if gid_s.startswith('-100') else gid_s
+    return f"https://t.me/c/{clean_group_id}/"
+
+@functools.lru_cache(maxsize=1024)
+def _relay_markup(user_id: int) -> InlineKeyboardMarkup:
+    """Action buttons attached to relayed messages; cached per user since
+    the layout is static and only the callback ids vary."""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("Reply to User", callback_data=f"reply_{user_id}")],
+        [InlineKeyboardButton("Block User", callback_data=f"block_{user_id}")]
+    ])
+
+# Media relay dispatch: message attribute -> (label, bot send method, kwarg name, takes caption)
+MEDIA_DISPATCH = (
+    ("photo", "Photo", "send_photo", "photo", True),
+    ("video", "Video", "send_video", "video", True),
+    ("audio", "Audio", "send_audio", "audio", True),
+    ("voice", "Voice", "send_voice", "voice", True),
+    ("document", "Document", "send_document", "document", True),
+    ("sticker", "Sticker", "send_sticker", "sticker", False),
+    ("animation", "Animation", "send_animation", "animation", True),
+    ("video_note", "Video Note", "send_video_note", "video_note", False),
+)
+
+# Static notification template, formatted once per authentication event
+AUTH_NOTIFICATION_TEMPLATE = (
+    "🔐 *New Authentication*\n"
+    "👤 User: {name}\n"
+    "🆔 ID: `{user_id}`\n"
+    "⏰ Time: {time}\n"
+    "📝 Session: {session_type} ({minutes} min)"
+)
+
+# Group-log templates, formatted once per relayed message
+GROUP_MESSAGE_TEMPLATE = (
+    "📨 *Message from {name}*\n"
+    "👤 ID: `{user_id}`\n"
+    "⏰ Time: {time}\n\n"
+    "{content}"
+)
+
+GROUP_MEDIA_TEMPLATE = (
+    "📨 *{media_type} from {name}*\n"
+    "👤 ID: `{user_id}`\n"
+    "⏰ Time: {time}"
+)
+
+# Admin /status body; the session-length lines never change at runtime
+ADMIN_STATUS_TEMPLATE = (
+    "*Bot Status*\n\n"
+    "🕒 Uptime: {uptime}\n"
+    "👥 Authenticated users: {users}\n"
+    "🔄 Active sessions: {active}\n"
+    "💾 Backups: {backups}\n\n"
+    "*Session Settings*\n"
+    f"⏱️ Standard session: {STD_SESSION_MIN} minutes\n"
+    f"⏱️ Extended session: {EXT_SESSION_MIN} minutes"
+)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Send a message when the command /start is issued."""
     user_id = update.effective_user.id
@@ -190,9 +504,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     
     # Check if user is already authenticated with a valid session
     if bot_data.is_session_valid(user_id):
-        session_info = bot_data.authenticated_users[str(user_id)]
+        session_info = bot_data.authenticated_users[user_id]
         session_type = session_info.get("session_type", "standard")
-        timeout_seconds = session_info.get("session_timeout", SESSION_TIMEOUT.total_seconds())
+        timeout_seconds = session_info.get("session_timeout", SESSION_TIMEOUT_SEC)
         minutes_remaining = int(timeout_seconds / 60)
         
         already_auth_msg = await update.message.reply_text(
@@ -201,13 +515,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             f"Session timeout: {minutes_remaining} minutes of inactivity."
         )
         # Auto-delete after 10 seconds
-        asyncio.create_task(delete_message_after_delay(already_auth_msg, 10))
+        schedule_message_delete(already_auth_msg, 10)
         return ConversationHandler.END
     
-    # User needs to authenticate
-    # Choose a random security question
-    questions = list(bot_data.security_questions.keys())
-    question = questions[0]  # Since we only have one question for simplicity
+    # User needs to authenticate with the cached security question
+    question = bot_data.auth_question
     
     # Send the question and store its message_id for validation in authenticate handler
     auth_message = await update.message.reply_text(
@@ -226,51 +538,42 @@ async def authenticate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     user_name = update.effective_user.first_name
     message_text = update.message.text
     
-    # Check if this is a reply to the authentication question
-    if not update.message.reply_to_message or update.message.reply_to_message.message_id != context.user_data.get('auth_message_id'):
+    # Check if this is a reply to the authentication question; bind the
+    # reply once and compare against the stored id with a single lookup
+    reply = update.message.reply_to_message
+    if reply is None or reply.message_id != context.user_data.get('auth_message_id', -1):
         # Not a reply to the authentication question
         try:
             await update.message.delete()
         except Exception as e:
-            logger.warning(f"Could not delete non-reply authentication message: {e}")
+            logger.warning("Could not delete non-reply authentication message: %s", e)
         
         error_msg = await update.message.reply_text(
             "Please reply directly to the authentication question."
         )
         
         # Schedule deletion of error message
-        asyncio.create_task(delete_message_after_delay(error_msg, 5))
+        schedule_message_delete(error_msg, 5)
         return AWAITING_AUTH_REPLY
     
-    # Check if the answer matches
-    question = list(bot_data.security_questions.keys())[0]
-    correct_answer = bot_data.security_questions[question]
     
     # Delete the authentication message for security
     try:
         await update.message.delete()
     except Exception as e:
-        logger.warning(f"Could not delete authentication message: {e}")
+        logger.warning("Could not delete authentication message: %s", e)
     
     # Try to delete the question message too
     try:
-        await update.message.reply_to_message.delete()
+        await reply.delete()
     except Exception as e:
-        logger.warning(f"Could not delete authentication question: {e}")
+        logger.warning("Could not delete authentication question: %s", e)
     
-    if message_text.lower() == correct_answer.lower():
+    if message_text.lower() == bot_data._auth_answer_lower:
         # Authentication successful - ask for session type
-        keyboard = [
-            [
-                InlineKeyboardButton("Standard Session (15 min)", callback_data="session_standard"),
-                InlineKeyboardButton("Extended Session (24h)", callback_data="session_extended")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await update.message.reply_text(
             "Authentication successful! Please choose your session type:",
-            reply_markup=reply_markup
+            reply_markup=SESSION_TYPE_MARKUP
         )
         
         return SESSION_SELECTION
@@ -280,7 +583,7 @@ async def authenticate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         )
         
         # Schedule deletion of error message
-        asyncio.create_task(delete_message_after_delay(error_msg, 5))
+        schedule_message_delete(error_msg, 5)
         return ConversationHandler.END
 
 async def session_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -291,37 +594,42 @@ async def session_selection(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     
     # Check which session type was selected
-    session_type = "standard"
-    session_timeout = SESSION_TIMEOUT
     if "extended" in query.data:
         session_type = "extended"
-        session_timeout = EXTENDED_SESSION_TIMEOUT
-    
-    # Calculate expiration time
-    current_time = datetime.now()
-    expiry_time = current_time + session_timeout
-    session_minutes = int(session_timeout.total_seconds() / 60)
-    
+        session_timeout_seconds = EXTENDED_SESSION_TIMEOUT_SEC
+        session_minutes = EXT_SESSION_MIN
+    else:
+        session_type = "standard"
+        session_timeout_seconds = SESSION_TIMEOUT_SEC
+        session_minutes = STD_SESSION_MIN
+
+    # Calculate expiration time; stored as epoch floats, rendered only for display
+    now_ts = time.time()
+    expiry_ts = now_ts + session_timeout_seconds
+
     # Authenticate the user with the appropriate session timeout
-    bot_data.authenticated_users[str(user_id)] = {
+    bot_data.authenticated_users[user_id] = {
         "name": user_name,
-        "authenticated_at": current_time.isoformat(),
-        "last_activity": current_time.isoformat(),
+        "authenticated_at": now_ts,
+        "last_activity": now_ts,
         "session_type": session_type,
-        "session_timeout": session_timeout.total_seconds(),
-        "expiry_time": expiry_time.isoformat()
+        "session_timeout": session_timeout_seconds,
+        "expiry_time": expiry_ts
     }
-    bot_data.save_to_file()
+    if user_id != ADMIN_ID:
+        bot_data._recipient_ids.add(user_id)
+    heapq.heappush(bot_data._expiry_heap, (expiry_ts, user_id))
+    await bot_data.save_to_file_async()
         
     # Send detailed authentication notification to backup group with action buttons
     if GROUP_ID:
         try:
-            auth_message = (
-                f"🔐 *New Authentication*\n"
-                f"👤 User: {user_name}\n"
-                f"🆔 ID: `{user_id}`\n"
-                f"⏰ Time: {current_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
-                f"📝 Session: {session_type.capitalize()} ({session_minutes} min)"
+            auth_message = AUTH_NOTIFICATION_TEMPLATE.format(
+                name=escape_markdown(user_name or ""),
+                user_id=user_id,
+                time=datetime.fromtimestamp(now_ts).strftime('%Y-%m-%d %H:%M:%S'),
+                session_type=session_type.capitalize(),
+                minutes=session_minutes
             )
             
             # Create action buttons for the admin to manage this user
@@ -338,17 +646,18 @@ async def session_selection(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 parse_mode=ParseMode.MARKDOWN
             )
         except Exception as e:
-            logger.error(f"Failed to send authentication notification to group: {e}")
+            logger.error("Failed to send authentication notification to group: %s", e)
     
     # Remove the keyboard and update the message with auto-deletion after 7 seconds
     success_msg = await query.edit_message_text(
         text=f"Authentication successful! You have a {session_type} session."
     )
     # Auto-delete after 7 seconds
-    asyncio.create_task(delete_message_after_delay(success_msg, 7))
+    schedule_message_delete(success_msg, 7)
     
     # Send session information to the user with auto-deletion after 5 seconds
-    expire_info = f"{expiry_time.strftime('%H:%M:%S')}" if session_type == "standard" else f"{expiry_time.strftime('%Y-%m-%d %H:%M:%S')}"
+    expiry_dt = datetime.fromtimestamp(expiry_ts)
+    expire_info = f"{expiry_dt.strftime('%H:%M:%S')}" if session_type == "standard" else f"{expiry_dt.strftime('%Y-%m-%d %H:%M:%S')}"
     
     session_info_msg = await context.bot.send_message(
         chat_id=user_id,
@@ -363,14 +672,33 @@ async def session_selection(update: Update, context: ContextTypes.DEFAULT_TYPE)
         parse_mode=ParseMode.MARKDOWN
     )
     # Auto-delete after 5 seconds
-    asyncio.create_task(delete_message_after_delay(session_info_msg, 5))
+    schedule_message_delete(session_info_msg, 5)
         
     return ConversationHandler.END
 
+async def _attempt_history_delete(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
+    """Try the direct history delete, then the known fallbacks."""
+    try:
+        # Try the direct method first, unless it is already known to
+        # fail for this chat
+        if bot_data._delete_history_capable.get(user_id) is False:
+            raise RuntimeError("delete_chat_history known to fail for this chat")
+        await context.bot.delete_chat_history(chat_id=user_id)
+        bot_data._delete_history_capable[user_id] = True
+    except Exception as e:
+        bot_data._delete_history_capable[user_id] = False
+        logger.warning("Primary deletion method failed: %s", e)
+        
+        # Fallback approach: use deleteChatPhoto API method, which often triggers chat cleanup
+        try:
+            await context.bot.delete_chat_photo(chat_id=user_id)
+        except Exception:
+            pass
+
 async def clear_chat_history(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
     """Clear chat history for a user using a more reliable approach."""
     try:
-        logger.info(f"Clearing chat history for user {user_id}")
+        logger.info("Clearing chat history for user %s", user_id)
         
         # Send message before clearing
         await context.bot.send_message(
@@ -379,28 +707,7 @@ async def clear_chat_history(context: ContextTypes.DEFAULT_TYPE, user_id: int) -
             parse_mode=ParseMode.MARKDOWN
         )
         
-        await asyncio.sleep(1)  # Brief pause
-        
-        try:
-            # Try the direct method first
-            await context.bot.delete_chat_history(chat_id=user_id)
-        except Exception as e:
-            logger.warning(f"Primary deletion method failed: {e}")
-            
-            # Fallback approach: use deleteChatPhoto API method, which often triggers chat cleanup
-            try:
-                await context.bot.delete_chat_photo(chat_id=user_id)
-            except Exception:
-                # If that fails too, try another approach
-                pass
-                
-            # Alternative approach: delete the current chat
-            try:
-                await context.bot.leave_chat(chat_id=user_id)
-                await asyncio.sleep(0.5)
-                # Bot will need to be restarted by the user
-            except Exception:
-                pass
+        await _attempt_history_delete(context, user_id)
         
         # Notify user that history should be cleared or to do it manually
         await context.bot.send_message(
@@ -413,9 +720,9 @@ async def clear_chat_history(context: ContextTypes.DEFAULT_TYPE, user_id: int) -
             parse_mode=ParseMode.MARKDOWN
         )
         
-        logger.info(f"Chat history clearing attempted for user {user_id}")
+        logger.info("Chat history clearing attempted for user %s", user_id)
     except Exception as e:
-        logger.error(f"Failed to clear chat history for user {user_id}: {e}")
+        logger.error("Failed to clear chat history for user %s: %s", user_id, e)
         try:
             # Notify user of failure with manual instructions
             await context.bot.send_message(
@@ -433,10 +740,8 @@ async def clear_chat_history(context: ContextTypes.DEFAULT_TYPE, user_id: int) -
 async def schedule_chat_clear(context: ContextTypes.DEFAULT_TYPE, user_id: int, delay_seconds: int) -> None:
     """Schedule clearing chat history after the specified delay."""
     # Schedule the task to run after the specified delay
-    asyncio.create_task(
-        delayed_chat_clear(context, user_id, delay_seconds)
-    )
-    logger.info(f"Scheduled chat history clear for user {user_id} in {delay_seconds} seconds")
+    context.application.create_task(delayed_chat_clear(context, user_id, delay_seconds))
+    logger.info("Scheduled chat history clear for user %s in %s seconds", user_id, delay_seconds)
 
 async def delayed_chat_clear(context: ContextTypes.DEFAULT_TYPE, user_id: int, delay_seconds: int) -> None:
     """Wait for the specified delay and then clear chat history."""
@@ -447,6 +752,56 @@ async def delayed_chat_clear(context: ContextTypes.DEFAULT_TYPE, user_id: int, d
         await clear_chat_history(context, user_id)
     # Otherwise, the session is still valid, so don't clear yet
 
+async def _terminate_one(context: ContextTypes.DEFAULT_TYPE, user_id_int: int) -> None:
+    """Notify one user their session was terminated and clear their chat.
+
+    One send plus one in-place edit instead of separate terminated /
+    clearing / cleared messages; edits are cheaper against the send quota.
+    """
+    try:
+        await send_bucket.acquire()
+        notice = await context.bot.send_message(
+            chat_id=user_id_int,
+            text="⚠️ *Your session has been terminated by admin.*\n"
+                 "🧹 Clearing chat history...",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        await _attempt_history_delete(context, user_id_int)
+        try:
+            await notice.edit_text(
+                "✅ Chat history clearing attempted.\n"
+                "Session ended — use /start to authenticate again."
+            )
+        except Exception:
+            # The notice may be gone if the history delete succeeded
+            pass
+    except Exception as e:
+        logger.error("Failed to notify user %s of session termination: %s", user_id_int, e)
+
+async def _perform_clearall(context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Clear every authenticated session and notify the affected users.
+
+    Returns the number of sessions that were cleared."""
+    # Get list of users before clearing
+    users_to_clear = list(bot_data.authenticated_users.keys())
+    user_count = len(users_to_clear)
+    
+    # Reset authenticated users; run the save off the event loop
+    bot_data.authenticated_users = {}
+    bot_data._recipient_ids.clear()
+    await bot_data.save_to_file_async()
+    
+    # Notify users in the background so the admin confirmation is not
+    # held up by the rate-limited fan-out
+    async def _notify_all():
+        await asyncio.gather(
+            *(_terminate_one(context, user_id_int)
+              for user_id_int in users_to_clear if user_id_int != ADMIN_ID),
+            return_exceptions=True
+        )
+    context.application.create_task(_notify_all())
+    return user_count
+
 async def clearall_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Clear all authenticated users except the admin."""
     user_id = update.effective_user.id
@@ -463,313 +818,260 @@ async def clearall_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         await update.message.reply_text("ℹ️ There are no authenticated users to clear.")
         return
     
-    # Ask for confirmation with inline keyboard
-    keyboard = [
-        [InlineKeyboardButton("Yes, clear all", callback_data="confirm_clearall")],
-        [InlineKeyboardButton("Cancel", callback_data="cancel_clearall")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
+    # Ask for confirmation with the prebuilt inline keyboard
     await update.message.reply_text(
         f"⚠️ *WARNING*\nThis will remove *{auth_count}* authenticated users and terminate all active sessions.\n\n"
         f"Are you sure you want to continue?",
-        reply_markup=reply_markup,
+        reply_markup=CLEARALL_CONFIRM_MARKUP,
         parse_mode=ParseMode.MARKDOWN
     )
 
-async def clearall_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle clearall confirmation button."""
+class ORJSONRequest(HTTPXRequest):
+    """HTTPXRequest that decodes Bot API responses with orjson."""
+
+    @staticmethod
+    def parse_json_payload(payload: bytes):
+        return orjson.loads(payload)
+
+# Every incoming update is JSON-decoded once; use orjson for that hot
+# path when it's installed, falling back to PTB's stdlib decoder
+REQUEST_CLASS = ORJSONRequest if HAS_ORJSON else HTTPXRequest
+
+# Precompiled callback-data patterns, shared by the handler registrations
+# so each incoming callback query is matched against compiled re.Pattern
+# objects rather than strings recompiled per construction
+CB_AUTH_RE = re.compile(r"^auth$")
+CB_SESSION_RE = re.compile(r"^session_")
+CB_REPLY_RE = re.compile(r"^reply_")
+CB_BLOCK_RE = re.compile(r"^block_")
+CB_TERMINATE_RE = re.compile(r"^terminate_")
+CB_SHOWME_RE = re.compile(r"^showme_")
+CB_CONFIRM_CLEARALL_RE = re.compile(r"^confirm_clearall$")
+CB_CANCEL_CLEARALL_RE = re.compile(r"^cancel_clearall$")
+
+def admin_only_callback(handler):
+    """Reject button presses from non-admin users before dispatching."""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        query = update.callback_query
+        if query.from_user.id != ADMIN_ID:
+            await query.answer("You're not authorized to use these controls.")
+            return
+        await handler(update, context)
+    return wrapper
+
+async def _cb_auth(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Authentication button pressed by a non-admin user."""
     query = update.callback_query
-    user_id = update.effective_user.id
-    
-    if user_id != ADMIN_ID:
-        await query.answer("You are not authorized to perform this action.", show_alert=True)
-        return
-    
-    action = query.data
-    
-    if action == "confirm_clearall":
-        # Get list of users before clearing
-        users_to_clear = list(bot_data.authenticated_users.keys())
-        user_count = len(users_to_clear)
-        
-        # Reset authenticated users
-        bot_data.authenticated_users = {}
-        bot_data.save_to_file()
+    await query.answer("Please use /start command to authenticate.")
+    await query.message.reply_text("Please use /start command to begin authentication.")
+
+async def _cb_session_wait(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Session-type buttons are handled by session_selection; just ack."""
+    await update.callback_query.answer("Please wait...")
+
+@admin_only_callback
+async def _cb_reply(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Reply-to-user button."""
+    query = update.callback_query
+    try:
+        target_id = int(query.data[len("reply_"):])
+        await query.answer("Please type your reply to this message.")
+        await query.edit_message_reply_markup(reply_markup=None)
         
-        # Update the callback message
-        await query.edit_message_text(
-            f"✅ Successfully cleared {user_count} authenticated users.\n"
-            f"All sessions have been terminated."
+        # Add a note to the message indicating reply mode
+        await query.message.reply_text(
+            f"✏️ *Reply Mode Activated*\n"
+            f"Reply to this message to send a response to user ID: `{target_id}`",
+            parse_mode=ParseMode.MARKDOWN
         )
+    except Exception as e:
+        logger.error("Error setting up reply: %s", e)
+        await query.answer(f"Error setting up reply: {e}")
+
+@admin_only_callback
+async def _cb_block(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Block-user button."""
+    query = update.callback_query
+    try:
+        target_id = int(query.data[len("block_"):])
         
-        # Notify users that their sessions were terminated
-        for user_id_str in users_to_clear:
+        if target_id not in bot_data.blocked_users:
+            bot_data.blocked_users.add(target_id)
+            
+            # Remove from authenticated users if present
+            bot_data.authenticated_users.pop(target_id, None)
+            bot_data._recipient_ids.discard(target_id)
+
+            await bot_data.save_to_file_async()
+            
+            await query.answer(f"User {target_id} has been blocked.")
+            # One edit carries the outcome and drops the buttons instead
+            # of a reply-markup edit plus a separate reply
+            await query.edit_message_text(
+                f"{query.message.text}\n\n✅ User {target_id} has been blocked."
+            )
+            
+            # Notify the user
             try:
-                user_id_int = int(user_id_str)
-                
-                # Skip if it's the admin
-                if user_id_int == ADMIN_ID:
-                    continue
-                
-                # Send notification to the user
                 await context.bot.send_message(
-                    chat_id=user_id_int,
-                    text="⚠️ *Your session has been terminated by admin.*\n"
-                         "You must authenticate again with /start to continue.",
-                    parse_mode=ParseMode.MARKDOWN
+                    chat_id=target_id,
+                    text="You have been blocked from using this bot."
                 )
                 
-                # Clear their chat history
-                try:
-                    await context.bot.send_message(
-                        chat_id=user_id_int,
-                        text="🧹 Clearing chat history for privacy...",
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                    await asyncio.sleep(1)
-                    await context.bot.delete_chat_history(chat_id=user_id_int)
-                    await context.bot.send_message(
-                        chat_id=user_id_int,
-                        text="✅ Chat history cleared.",
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to clear chat history for user {user_id_int}: {e}")
+                # Also clear their chat history
+                await clear_chat_history(context, target_id)
                 
             except Exception as e:
-                logger.error(f"Failed to notify user {user_id_str} of session termination: {e}")
-        
-    elif action == "cancel_clearall":
-        await query.edit_message_text("❌ Clear all operation canceled.")
-    
-    # Answer the callback query
-    await query.answer()
+                logger.error("Could not notify user about being blocked: %s", e)
+        else:
+            await query.answer(f"User {target_id} is already blocked.")
+    except Exception as e:
+        logger.error("Error blocking user: %s", e)
+        await query.answer(f"Error blocking user: {e}")
 
-async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle button callbacks."""
+@admin_only_callback
+async def _cb_terminate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Terminate-session button."""
     query = update.callback_query
-    user_id = query.from_user.id
-    
-    # Only admin can interact with these buttons, except auth button
-    if user_id != ADMIN_ID and not query.data.startswith("session_"):
-        await query.answer("You're not authorized to use these controls.")
-        return
-    
-    callback_data = query.data
-    
-    # Handle authentication button pressed by non-admin user
-    if callback_data == "auth":
-        await query.answer("Please use /start command to authenticate.")
-        await query.message.reply_text("Please use /start command to begin authentication.")
-        return
-    
-    # Session type selection
-    elif callback_data.startswith("session_"):
-        # This is handled by session_selection function
-        await query.answer("Please wait...")
-        return
-    
-    # Reply to user button
-    elif callback_data.startswith("reply_"):
-        try:
-            target_id = int(callback_data.split("_")[1])
-            await query.answer("Please type your reply to this message.")
-            await query.edit_message_reply_markup(reply_markup=None)
+    try:
+        target_id = int(query.data[len("terminate_"):])
+        
+        # Remove from authenticated users if present
+        if bot_data.authenticated_users.pop(target_id, None) is not None:
+            bot_data._recipient_ids.discard(target_id)
+            await bot_data.save_to_file_async()
             
-            # Add a note to the message indicating reply mode
-            await query.message.reply_text(
-                f"✏️ *Reply Mode Activated*\n"
-                f"Reply to this message to send a response to user ID: `{target_id}`",
-                parse_mode=ParseMode.MARKDOWN
+            await query.answer(f"Session for user {target_id} has been terminated.")
+            await query.edit_message_text(
+                f"{query.message.text}\n\n✅ Session for user {target_id} has been terminated."
             )
-        except Exception as e:
-            logger.error(f"Error setting up reply: {e}")
-            await query.answer(f"Error setting up reply: {e}")
-    
-    # Block user button
-    elif callback_data.startswith("block_"):
-        try:
-            target_id = int(callback_data.split("_")[1])
-            
-            if target_id not in bot_data.blocked_users:
-                bot_data.blocked_users.append(target_id)
-                
-                # Remove from authenticated users if present
-                if str(target_id) in bot_data.authenticated_users:
-                    del bot_data.authenticated_users[str(target_id)]
-                
-                bot_data.save_to_file()
-                
-                await query.answer(f"User {target_id} has been blocked.")
-                await query.edit_message_reply_markup(reply_markup=None)
-                await query.message.reply_text(f"✅ User {target_id} has been blocked.")
-                
-                # Notify the user
-                try:
-                    await context.bot.send_message(
-                        chat_id=target_id,
-                        text="You have been blocked from using this bot."
-                    )
-                    
-                    # Also clear their chat history
-                    await clear_chat_history(context, target_id)
-                    
-                except Exception as e:
-                    logger.error(f"Could not notify user about being blocked: {e}")
-            else:
-                await query.answer(f"User {target_id} is already blocked.")
-        except Exception as e:
-            logger.error(f"Error blocking user: {e}")
-            await query.answer(f"Error blocking user: {e}")
-    
-    # Terminate session button
-    elif callback_data.startswith("terminate_"):
-        try:
-            target_id = int(callback_data.split("_")[1])
-            
-            # Remove from authenticated users if present
-            if str(target_id) in bot_data.authenticated_users:
-                del bot_data.authenticated_users[str(target_id)]
-                bot_data.save_to_file()
-                
-                await query.answer(f"Session for user {target_id} has been terminated.")
-                await query.edit_message_reply_markup(reply_markup=None)
-                await query.message.reply_text(f"✅ Session for user {target_id} has been terminated.")
-                
-                # Notify the user
-                try:
-                    # Send termination notification
-                    await context.bot.send_message(
-                        chat_id=target_id,
-                        text="⚠️ *Your session has been terminated by admin.*\nYou must authenticate again with /start to continue.",
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                    
-                    # Clear chat history using our improved function
-                    await clear_chat_history(context, target_id)
-                    
-                except Exception as e:
-                    logger.error(f"Could not notify user about session termination: {e}")
-            else:
-                await query.answer(f"User {target_id} is not currently authenticated.")
-        except Exception as e:
-            logger.error(f"Error terminating session: {e}")
-            await query.answer(f"Error terminating session: {e}")
-    
-    # Show message details
-    elif callback_data.startswith("showme_"):
-        try:
-            msg_id = int(callback_data.split("_")[1])
             
-            # Check if we have this message mapped
-            message_map = context.bot_data.get('message_map', {})
-            if str(msg_id) in message_map:
-                group_info = message_map[str(msg_id)]
-                group_id = group_info['chat_id']
-                group_msg_id = group_info['message_id']
-                
-                # Remove the -100 prefix for the URL
-                if str(group_id).startswith('-100'):
-                    clean_group_id = str(group_id)[4:]
-                else:
-                    clean_group_id = str(group_id)
-                
-                # Create the message link
-                message_link = f"https://t.me/c/{clean_group_id}/{group_msg_id}"
+            # Notify the user
+            try:
+                # Send termination notification
+                await context.bot.send_message(
+                    chat_id=target_id,
+                    text="⚠️ *Your session has been terminated by admin.*\nYou must authenticate again with /start to continue.",
+                    parse_mode=ParseMode.MARKDOWN
+                )
                 
-                keyboard = [[InlineKeyboardButton("View Details", url=message_link)]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                # Clear chat history using our improved function
+                await clear_chat_history(context, target_id)
                 
-                await query.answer("Link to message details generated")
-                await query.edit_message_reply_markup(reply_markup=reply_markup)
-            else:
-                await query.answer("Could not find message details")
-        except Exception as e:
-            logger.error(f"Error generating message link: {e}")
-            await query.answer(f"Error generating message link")
-    
-    # Handle clearall confirmation
-    elif callback_data == "confirm_clearall":
-        try:
-            # Get list of users before clearing
-            users_to_clear = list(bot_data.authenticated_users.keys())
-            user_count = len(users_to_clear)
+            except Exception as e:
+                logger.error("Could not notify user about session termination: %s", e)
+        else:
+            await query.answer(f"User {target_id} is not currently authenticated.")
+    except Exception as e:
+        logger.error("Error terminating session: %s", e)
+        await query.answer(f"Error terminating session: {e}")
+
+@admin_only_callback
+async def _cb_showme(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show-message-details button."""
+    query = update.callback_query
+    try:
+        msg_id = int(query.data[len("showme_"):])
+        
+        # Check if we have this message mapped
+        group_info = context.bot_data['message_map'].get(msg_id)
+        if group_info is not None:
+            group_id = group_info['chat_id']
+            group_msg_id = group_info['message_id']
             
-            # Reset authenticated users
-            bot_data.authenticated_users = {}
-            bot_data.save_to_file()
+            # Create the message link from the cached prefix
+            message_link = f"{_group_link_prefix(group_id)}{group_msg_id}"
             
-            # Update the callback message
-            await query.edit_message_text(
-                f"✅ Successfully cleared {user_count} authenticated users.\n"
-                f"All sessions have been terminated."
-            )
+            keyboard = [[InlineKeyboardButton("View Details", url=message_link)]]
+            reply_markup = InlineKeyboardMarkup(keyboard)
             
-            # Notify users that their sessions were terminated
-            for user_id_str in users_to_clear:
-                try:
-                    user_id_int = int(user_id_str)
-                    
-                    # Skip if it's the admin
-                    if user_id_int == ADMIN_ID:
-                        continue
-                    
-                    # Send notification to the user
-                    await context.bot.send_message(
-                        chat_id=user_id_int,
-                        text="⚠️ *Your session has been terminated by admin.*\n"
-                             "You must authenticate again with /start to continue.",
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                    
-                    # Clear their chat history using our improved function
-                    await clear_chat_history(context, user_id_int)
-                    
-                except Exception as e:
-                    logger.error(f"Failed to notify user {user_id_str} of session termination: {e}")
-        except Exception as e:
-            logger.error(f"Error clearing users: {e}")
-            await query.answer(f"Error clearing users: {e}")
-    
-    # Handle clearall cancellation
-    elif callback_data == "cancel_clearall":
-        await query.answer("Operation cancelled.")
-        await query.edit_message_text("❌ Clear all operation cancelled.")
+            await query.answer("Link to message details generated")
+            await query.edit_message_reply_markup(reply_markup=reply_markup)
+        else:
+            await query.answer("Could not find message details")
+    except Exception as e:
+        logger.error("Error generating message link: %s", e)
+        await query.answer(f"Error generating message link")
+
+@admin_only_callback
+async def _cb_confirm_clearall(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Clearall confirmation button."""
+    query = update.callback_query
+    try:
+        await query.answer()
+        user_count = await _perform_clearall(context)
+        
+        # Update the callback message
+        await query.edit_message_text(
+            f"✅ Successfully cleared {user_count} authenticated users.\n"
+            f"All sessions have been terminated."
+        )
+    except Exception as e:
+        logger.error("Error clearing users: %s", e)
+        await query.answer(f"Error clearing users: {e}")
+
+@admin_only_callback
+async def _cb_cancel_clearall(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Clearall cancellation button."""
+    query = update.callback_query
+    await query.answer("Operation cancelled.")
+    await query.edit_message_text("❌ Clear all operation cancelled.")
+
+# Static help/command texts, built once at import time
+ADMIN_HELP_TEXT = (
+    "*🤖 GT-UP Bot - Admin Help*\n\n"
+    "This bot allows users to send you messages after authentication.\n\n"
+    "*Key Features:*\n"
+    "• Secure authentication with custom security question\n"
+    "• Backup group for message logging\n"
+    "• Session management (15-minute timeout)\n"
+    "• User blocking capabilities\n\n"
+    "Use /cmd to see all available commands."
+)
+
+USER_HELP_TEXT = (
+    "*🤖 GT-UP Bot - Help*\n\n"
+    "This bot allows you to send messages to the admin.\n\n"
+    "*How to use:*\n"
+    "1. Use /start to authenticate\n"
+    "2. Answer the security question correctly\n"
+    "3. Send your message once authenticated\n\n"
+    "*Notes:*\n"
+    "• Your session expires after 15 minutes of inactivity\n"
+    "• Use /status to check your authentication status"
+)
+
+ADMIN_CMD_TEXT = (
+    "*Available Commands*\n\n"
+    "General commands:\n"
+    "/start - Start the bot and authenticate\n"
+    "/status - Show bot status\n"
+    "/help - Show help message\n"
+    "/cmd - Show this command list\n\n"
+    
+    "Admin commands:\n"
+    "/broadcast - Send message to all authenticated users\n"
+    "/clearall - Clear all authenticated users\n"
+    "/showme - Show message details in backup group"
+)
+
+USER_CMD_TEXT = (
+    "*Available Commands*\n\n"
+    "/start - Start the bot and authenticate\n"
+    "/status - Check your authentication status\n"
+    "/help - Show help message\n"
+    "/cmd - Show this command list"
+)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /help is issued."""
     user_id = update.effective_user.id
     
-    if user_id == ADMIN_ID:
-        help_text = (
-            "*🤖 GT-UP Bot - Admin Help*\n\n"
-            "This bot allows users to send you messages after authentication.\n\n"
-            "*Key Features:*\n"
-            "• Secure authentication with custom security question\n"
-            "• Backup group for message logging\n"
-            "• Session management (15-minute timeout)\n"
-            "• User blocking capabilities\n\n"
-            "Use /cmd to see all available commands."
-        )
-        help_msg = await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
-        # Schedule deletion of help message after 13 seconds
-        asyncio.create_task(delete_message_after_delay(help_msg, 13))
-    else:
-        help_text = (
-            "*🤖 GT-UP Bot - Help*\n\n"
-            "This bot allows you to send messages to the admin.\n\n"
-            "*How to use:*\n"
-            "1. Use /start to authenticate\n"
-            "2. Answer the security question correctly\n"
-            "3. Send your message once authenticated\n\n"
-            "*Notes:*\n"
-            "• Your session expires after 15 minutes of inactivity\n"
-            "• Use /status to check your authentication status"
-        )
-        help_msg = await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
-        # Schedule deletion of help message after 13 seconds
-        asyncio.create_task(delete_message_after_delay(help_msg, 13))
+    help_text = ADMIN_HELP_TEXT if user_id == ADMIN_ID else USER_HELP_TEXT
+    help_msg = await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
+    # Schedule deletion of help message after 13 seconds
+    schedule_message_delete(help_msg, 13)
 
 async def cmd_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Show available commands."""
@@ -781,39 +1083,17 @@ async def cmd_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             "❌ You are not authenticated. Please use /start to authenticate."
         )
         # Auto-delete the message after 15 seconds
-        asyncio.create_task(delete_message_after_delay(not_auth_msg, 15))
+        schedule_message_delete(not_auth_msg, 15)
         return
     
-    # Update last activity for authenticated users
-    if str(user_id) in bot_data.authenticated_users:
-        bot_data.update_activity(user_id)
+    # Update last activity for authenticated users; one lookup feeds the
+    # touch instead of a membership check followed by a second get
+    record = bot_data.authenticated_users.get(user_id)
+    if record is not None:
+        bot_data.update_activity(user_id, record)
     
-    # Build command list
-    if user_id == ADMIN_ID:
-        commands = (
-            "*Available Commands*\n\n"
-            "General commands:\n"
-            "/start - Start the bot and authenticate\n"
-            "/status - Show bot status\n"
-            "/help - Show help message\n"
-            "/cmd - Show this command list\n\n"
-            
-            "Admin commands:\n"
-            "/broadcast - Send message to all authenticated users\n"
-            "/clearall - Clear all authenticated users\n"
-            "/showme - Show message details in backup group"
-        )
-    else:
-        commands = (
-            "*Available Commands*\n\n"
-            "/start - Start the bot and authenticate\n"
-            "/status - Check your authentication status\n"
-            "/help - Show help message\n"
-            "/cmd - Show this command list"
-        )
-            
     await update.message.reply_text(
-        commands,
+        ADMIN_CMD_TEXT if user_id == ADMIN_ID else USER_CMD_TEXT,
         parse_mode=ParseMode.MARKDOWN
         )
 
@@ -821,36 +1101,30 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Show bot status information."""
     user_id = update.effective_user.id
     
+    # Read the clock once and derive every timestamp in this handler from it
+    now = datetime.now()
+
     # Calculate uptime
-    uptime = datetime.now() - bot_data.start_time
+    uptime = now - bot_data.start_time
     days, remainder = divmod(uptime.total_seconds(), 86400)
     hours, remainder = divmod(remainder, 3600)
     minutes, seconds = divmod(remainder, 60)
     
     uptime_str = f"{int(days)}d {int(hours)}h {int(minutes)}m {int(seconds)}s"
     
-    # Count active sessions
-    active_sessions = 0
-    for user_id_str, user_data in bot_data.authenticated_users.items():
-        if bot_data.is_session_valid(int(user_id_str)):
-            active_sessions += 1
+    # Count active sessions (cached with a short TTL)
+    active_sessions = bot_data.active_session_count()
     
-    # Count backups
-    backup_count = 0
-    if os.path.exists(BACKUP_DIR):
-        backup_count = len([f for f in os.listdir(BACKUP_DIR) if f.startswith("bot_data_") and f.endswith(".json")])
+    # Backup count is maintained by the backup writer; no directory scan
+    backup_count = bot_data._backup_count
     
     # If user is admin, show detailed status
     if user_id == ADMIN_ID:
-        status_message = (
-            f"*Bot Status*\n\n"
-            f"🕒 Uptime: {uptime_str}\n"
-            f"👥 Authenticated users: {len(bot_data.authenticated_users)}\n"
-            f"🔄 Active sessions: {active_sessions}\n"
-            f"💾 Backups: {backup_count}\n\n"
-            f"*Session Settings*\n"
-            f"⏱️ Standard session: {int(SESSION_TIMEOUT.total_seconds()/60)} minutes\n"
-            f"⏱️ Extended session: {int(EXTENDED_SESSION_TIMEOUT.total_seconds()/60)} minutes"
+        status_message = ADMIN_STATUS_TEMPLATE.format(
+            uptime=uptime_str,
+            users=len(bot_data.authenticated_users),
+            active=active_sessions,
+            backups=backup_count
         )
         
         await update.message.reply_text(
@@ -860,20 +1134,21 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     else:
         # Check if user is authenticated
         if bot_data.is_session_valid(user_id):
-            user_data = bot_data.authenticated_users[str(user_id)]
+            user_data = bot_data.authenticated_users[user_id]
             session_type = user_data.get("session_type", "standard")
-            authenticated_at = datetime.fromisoformat(user_data.get("authenticated_at", datetime.now().isoformat()))
-            last_activity = datetime.fromisoformat(user_data.get("last_activity", datetime.now().isoformat()))
-            
-            time_since_auth = datetime.now() - authenticated_at
-            time_since_activity = datetime.now() - last_activity
-            
+            now_ts = now.timestamp()
+            authenticated_at = user_data.get("authenticated_at", now_ts)
+            last_activity = user_data.get("last_activity", now_ts)
+
+            minutes_since_auth = int((now_ts - authenticated_at) / 60)
+            minutes_since_activity = int((now_ts - last_activity) / 60)
+
             status_message = (
                 f"*Your Status*\n\n"
                 f"✅ Authenticated: Yes\n"
                 f"🔑 Session type: {session_type.capitalize()}\n"
-                f"⏰ Authenticated {int(time_since_auth.total_seconds()/60)} minutes ago\n"
-                f"⌛ Last activity: {int(time_since_activity.total_seconds()/60)} minutes ago\n"
+                f"⏰ Authenticated {minutes_since_auth} minutes ago\n"
+                f"⌛ Last activity: {minutes_since_activity} minutes ago\n"
                 f"🤖 Bot uptime: {uptime_str}"
             )
             
@@ -888,7 +1163,38 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             )
             
             # Auto-delete the "Not authenticated" message after 15 seconds
-            asyncio.create_task(delete_message_after_delay(not_auth_msg, 15))
+            schedule_message_delete(not_auth_msg, 15)
+
+def _update_env_group_id(group_id: str) -> None:
+    """Persist GROUP_ID to .env, rewriting the file only if it changed."""
+    with open(".env", "r") as file:
+        env_lines = file.readlines()
+
+    # Check if GROUP_ID already exists in the file
+    new_line = f"GROUP_ID={group_id}\n"
+    group_id_exists = False
+    needs_write = True
+    for i, line in enumerate(env_lines):
+        if line.startswith("GROUP_ID="):
+            group_id_exists = True
+            if line == new_line:
+                # Value is already current, skip the rewrite entirely
+                needs_write = False
+            else:
+                env_lines[i] = new_line
+            break
+
+    # If GROUP_ID doesn't exist, add it
+    if not group_id_exists:
+        env_lines.append(new_line)
+
+    # Write back atomically, only if something changed: a temp file
+    # plus os.replace means a crash can't leave a truncated .env
+    if needs_write:
+        tmp_file = ".env.tmp"
+        with open(tmp_file, "w") as file:
+            file.write("".join(env_lines))
+        os.replace(tmp_file, ".env")
 
 async def setup_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Command to set up the backup group."""
@@ -907,31 +1213,15 @@ async def setup_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     global GROUP_ID
     GROUP_ID = str(update.effective_chat.id)
     
-    # Save to .env file
+    # Save to .env file; the disk work runs in a worker thread so the
+    # event loop keeps servicing other handlers
     try:
-        with open(".env", "r") as file:
-            env_lines = file.readlines()
-        
-        # Check if GROUP_ID already exists in the file
-        group_id_exists = False
-        for i, line in enumerate(env_lines):
-            if line.startswith("GROUP_ID="):
-                env_lines[i] = f"GROUP_ID={GROUP_ID}\n"
-                group_id_exists = True
-                break
-        
-        # If GROUP_ID doesn't exist, add it
-        if not group_id_exists:
-            env_lines.append(f"GROUP_ID={GROUP_ID}\n")
-        
-        # Write back to the file
-        with open(".env", "w") as file:
-            file.writelines(env_lines)
-        
+        await asyncio.to_thread(_update_env_group_id, GROUP_ID)
+
         await update.message.reply_text(f"✅ Backup group has been set up with ID: {GROUP_ID}")
         await update.message.reply_text("This group will now receive all messages sent to the bot.")
     except Exception as e:
-        logger.error(f"Error updating .env file: {e}")
+        logger.error("Error updating .env file: %s", e)
         await update.message.reply_text(f"⚠️ Error saving group ID to .env file: {e}")
         await update.message.reply_text(f"Group ID set temporarily for this session: {GROUP_ID}")
 
@@ -952,23 +1242,31 @@ async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     
     broadcast_message = " ".join(context.args)
+    broadcast_text = f"📢 *Broadcast Message*\n\n{broadcast_message}"
+    recipient_ids = list(bot_data._recipient_ids)
+
+    async def _send_one(recipient_id: int):
+        await send_bucket.acquire()
+        return await context.bot.send_message(
+            chat_id=recipient_id,
+            text=broadcast_text,
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    # Send to all authenticated users in parallel instead of one round-trip at a time
+    results = await asyncio.gather(
+        *(_send_one(recipient_id) for recipient_id in recipient_ids),
+        return_exceptions=True
+    )
+
     sent_count = 0
     failed_count = 0
-    
-    # Send message to all authenticated users
-    for user_id_str, user_data in bot_data.authenticated_users.items():
-        user_id = int(user_id_str)
-        if user_id != ADMIN_ID:  # Don't send to yourself
-            try:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=f"📢 *Broadcast Message*\n\n{broadcast_message}",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                sent_count += 1
-            except Exception as e:
-                logger.error(f"Failed to send broadcast to user {user_id}: {e}")
-                failed_count += 1
+    for recipient_id, result in zip(recipient_ids, results):
+        if isinstance(result, Exception):
+            logger.error("Failed to send broadcast to user %s: %s", recipient_id, result)
+            failed_count += 1
+        else:
+            sent_count += 1
     
     await update.message.reply_text(
         f"✅ Broadcast sent to {sent_count} users\n"
@@ -1001,13 +1299,13 @@ async def block_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         
         # Add user to blocked list if not already blocked
         if target_user_id not in bot_data.blocked_users:
-            bot_data.blocked_users.append(target_user_id)
+            bot_data.blocked_users.add(target_user_id)
             
             # Remove from authenticated users if present
-            if str(target_user_id) in bot_data.authenticated_users:
-                del bot_data.authenticated_users[str(target_user_id)]
-            
-            bot_data.save_to_file()
+            bot_data.authenticated_users.pop(target_user_id, None)
+            bot_data._recipient_ids.discard(target_user_id)
+
+            await bot_data.save_to_file_async()
             await update.message.reply_text(f"User {target_user_id} has been blocked.")
         else:
             await update.message.reply_text(f"User {target_user_id} is already blocked.")
@@ -1036,7 +1334,7 @@ async def unblock_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         # Remove user from blocked list
         if target_user_id in bot_data.blocked_users:
             bot_data.blocked_users.remove(target_user_id)
-            bot_data.save_to_file()
+            await bot_data.save_to_file_async()
             await update.message.reply_text(f"User {target_user_id} has been unblocked.")
         else:
             await update.message.reply_text(f"User {target_user_id} is not blocked.")
@@ -1055,28 +1353,36 @@ async def list_users(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         await update.message.reply_text("No authenticated users found.")
         return
     
-    user_list = "*Authenticated Users:*\n\n"
-    for user_id_str, user_data in bot_data.authenticated_users.items():
-        user_id = user_id_str
+    parts = ["*Authenticated Users:*\n\n"]
+    for uid, user_data in bot_data.authenticated_users.items():
         name = user_data.get("name", "Unknown")
-        authenticated_at = user_data.get("authenticated_at", "Unknown")
+        authenticated_at = user_data.get("authenticated_at")
         session_type = user_data.get("session_type", "standard")
-        
-        user_list += f"• ID: `{user_id}`\n"
-        user_list += f"  Name: {name}\n"
-        user_list += f"  Session: {session_type}\n"
-        user_list += f"  Authenticated: {authenticated_at[:16]}\n\n"
-    
-    user_list += f"Total users: {len(bot_data.authenticated_users)}"
-    
-    try:
-        await update.message.reply_text(user_list, parse_mode=ParseMode.MARKDOWN)
-    except Exception:
-        # If the message is too long, split it
-        await update.message.reply_text("User list is too long, sending in parts...")
-        chunks = [user_list[i:i+4000] for i in range(0, len(user_list), 4000)]
-        for chunk in chunks:
-            await update.message.reply_text(chunk, parse_mode=ParseMode.MARKDOWN)
+
+        if isinstance(authenticated_at, (int, float)):
+            auth_display = datetime.fromtimestamp(authenticated_at).strftime('%Y-%m-%d %H:%M')
+        else:
+            auth_display = "Unknown"
+        parts.append(
+            f"• ID: `{uid}`\n"
+            f"  Name: {name}\n"
+            f"  Session: {session_type}\n"
+            f"  Authenticated: {auth_display}\n\n"
+        )
+    parts.append(f"Total users: {len(bot_data.authenticated_users)}")
+
+    # Send in chunks that break between user records, never mid-record
+    chunk: List[str] = []
+    chunk_len = 0
+    for part in parts:
+        if chunk and chunk_len + len(part) > 4000:
+            await update.message.reply_text("".join(chunk), parse_mode=ParseMode.MARKDOWN)
+            chunk = []
+            chunk_len = 0
+        chunk.append(part)
+        chunk_len += len(part)
+    if chunk:
+        await update.message.reply_text("".join(chunk), parse_mode=ParseMode.MARKDOWN)
 
 async def set_security_question(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Set a new security question and answer."""
@@ -1112,7 +1418,8 @@ async def set_security_question(update: Update, context: ContextTypes.DEFAULT_TY
     
     # Clear existing questions and set the new one
     bot_data.security_questions = {question: answer}
-    bot_data.save_to_file()
+    bot_data._refresh_auth_cache()
+    await bot_data.save_to_file_async()
     
     await update.message.reply_text(
         f"✅ Security question updated successfully.\n"
@@ -1123,7 +1430,8 @@ async def set_security_question(update: Update, context: ContextTypes.DEFAULT_TY
 async def showme_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Link to the original message in the backup group"""
     user_id = update.effective_user.id
-    
+    now = datetime.now()
+
     # Only admin can use this command
     if user_id != ADMIN_ID:
         await update.message.reply_text("This command is only available to the admin.")
@@ -1140,23 +1448,16 @@ async def showme_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     msg_id = update.message.reply_to_message.message_id
     
     # Check if we have this message mapped
-    message_map = context.bot_data.get('message_map', {})
-    if str(msg_id) in message_map:
-        group_info = message_map[str(msg_id)]
+    group_info = context.bot_data['message_map'].get(msg_id)
+    if group_info is not None:
         group_id = group_info['chat_id']
         group_msg_id = group_info['message_id']
         sender_id = group_info.get('sender_id', 'Unknown')
         sender_name = group_info.get('sender_name', 'Unknown')
         media_type = group_info.get('media_type', 'Message')
         
-        # Remove the -100 prefix for the URL
-        if str(group_id).startswith('-100'):
-            clean_group_id = str(group_id)[4:]
-        else:
-            clean_group_id = str(group_id)
-        
-        # Create the message link
-        message_link = f"https://t.me/c/{clean_group_id}/{group_msg_id}"
+        # Create the message link from the cached prefix
+        message_link = f"{_group_link_prefix(group_id)}{group_msg_id}"
         
         # Create buttons for various actions
         keyboard = [
@@ -1170,7 +1471,7 @@ async def showme_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             f"• From: {sender_name}\n"
             f"• ID: `{sender_id}`\n"
             f"• Type: {media_type}\n"
-            f"• Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+            f"• Time: {now.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
             f"Click the buttons below for actions:",
             reply_markup=reply_markup,
             parse_mode=ParseMode.MARKDOWN
@@ -1180,6 +1481,28 @@ async def showme_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             "Could not find the detailed message in the backup group."
         )
 
+# Replies for the shared expired/unauthenticated path
+SESSION_EXPIRED_TEXT = "Your session has expired. Please authenticate again with /start"
+AUTH_REQUIRED_TEXT = "You need to authenticate first. Please use /start command."
+
+async def _handle_unauthed(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
+    """Handle a message from a user with no valid session."""
+    # Authentication expired or user not authenticated
+    if bot_data.authenticated_users.pop(user_id, None) is not None:
+        # Session expired, remove the stale record
+        bot_data._recipient_ids.discard(user_id)
+        bot_data.mark_dirty()
+        auth_error = await update.message.reply_text(SESSION_EXPIRED_TEXT)
+        # Auto-delete after 10 seconds
+        schedule_message_delete(auth_error, 10)
+
+        # Clear chat history after session expiry
+        await clear_chat_history(context, user_id)
+    else:
+        auth_required = await update.message.reply_text(AUTH_REQUIRED_TEXT)
+        # Auto-delete after 10 seconds
+        schedule_message_delete(auth_required, 10)
+
 async def relay_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Relay text messages to admin and group."""
     user_id = update.effective_user.id
@@ -1195,35 +1518,21 @@ async def relay_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         # Just acknowledge, no reply functionality needed
         admin_msg = await update.message.reply_text("Message received.")
         # Auto-delete the confirmation after 5 seconds
-        asyncio.create_task(delete_message_after_delay(admin_msg, 5))
+        schedule_message_delete(admin_msg, 5)
         return
     
     # Check if user is authenticated and session is valid
-    if not bot_data.is_session_valid(user_id):
-        # Authentication expired or user not authenticated
-        if str(user_id) in bot_data.authenticated_users:
-            # Session expired, remove from authenticated users
-            del bot_data.authenticated_users[str(user_id)]
-            bot_data.save_to_file()
-            auth_error = await update.message.reply_text(
-                "Your session has expired. Please authenticate again with /start"
-            )
-            # Auto-delete after 10 seconds
-            asyncio.create_task(delete_message_after_delay(auth_error, 10))
-            
-            # Clear chat history after session expiry
-            await clear_chat_history(context, user_id)
-        else:
-            auth_required = await update.message.reply_text(
-                "You need to authenticate first. Please use /start command."
-            )
-            # Auto-delete after 10 seconds
-            asyncio.create_task(delete_message_after_delay(auth_required, 10))
+    session = bot_data.get_valid_session(user_id)
+    if session is None:
+        await _handle_unauthed(update, context, user_id)
         return
     
     # Update last activity timestamp for valid sessions
-    bot_data.update_activity(user_id)
+    bot_data.update_activity(user_id, session)
     
+    # Read the clock once; reused for the group metadata timestamp
+    now = datetime.now()
+
     # Get the message content
     message_content = update.message.text
     message_id = update.message.message_id
@@ -1232,7 +1541,7 @@ async def relay_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     try:
         await update.message.delete()
     except Exception as e:
-        logger.warning(f"Could not delete user message: {e}")
+        logger.warning("Could not delete user message: %s", e)
     
     # Send plain message to admin WITHOUT metadata header
     admin_msg = await context.bot.send_message(
@@ -1244,19 +1553,15 @@ async def relay_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     if GROUP_ID:
         try:
             # Send detailed message to group with action buttons
-            group_message = (
-                f"📨 *Message from {user_name}*\n"
-                f"👤 ID: `{user_id}`\n"
-                f"⏰ Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-                f"{message_content}"
+            group_message = GROUP_MESSAGE_TEMPLATE.format(
+                name=escape_markdown(user_name or ""),
+                user_id=user_id,
+                time=now.strftime('%Y-%m-%d %H:%M:%S'),
+                content=escape_markdown(message_content)
             )
             
-            # Create action buttons for admin
-            keyboard = [
-                [InlineKeyboardButton("Reply to User", callback_data=f"reply_{user_id}")],
-                [InlineKeyboardButton("Block User", callback_data=f"block_{user_id}")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            # Cached action buttons for admin
+            reply_markup = _relay_markup(user_id)
             
             group_msg = await context.bot.send_message(
                 chat_id=GROUP_ID,
@@ -1265,18 +1570,17 @@ async def relay_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                 reply_markup=reply_markup
             )
             
-            # Store message mapping for /showme command
-            if not hasattr(context.bot_data, 'message_map'):
-                context.bot_data['message_map'] = {}
-            
             # Map the admin message ID to the group message ID
-            context.bot_data['message_map'][str(admin_msg.message_id)] = {
+            context.bot_data['message_map'][admin_msg.message_id] = {
                 'chat_id': GROUP_ID,
                 'message_id': group_msg.message_id,
                 'sender_id': user_id,
                 'sender_name': user_name,
                 'media_type': "Message"
             }
+            message_map = context.bot_data['message_map']
+            while len(message_map) > MESSAGE_MAP_MAX:
+                message_map.popitem(last=False)
             
             # Send a single small note about /showme once per conversation
             if not context.user_data.get('showme_info_sent'):
@@ -1286,10 +1590,10 @@ async def relay_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                 )
                 context.user_data['showme_info_sent'] = True
                 # Delete this info after 10 seconds
-                asyncio.create_task(delete_message_after_delay(info_msg, 10))
+                schedule_message_delete(info_msg, 10)
             
         except Exception as e:
-            logger.error(f"Failed to relay message to group: {e}")
+            logger.error("Failed to relay message to group: %s", e)
     
     # Send confirmation that will be deleted
     confirm_msg = await context.bot.send_message(
@@ -1298,7 +1602,7 @@ async def relay_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     )
     
     # Delete confirmation after a short delay
-    asyncio.create_task(delete_message_after_delay(confirm_msg, 3))
+    schedule_message_delete(confirm_msg, 3)
 
 async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle non-text media messages."""
@@ -1315,64 +1619,35 @@ async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         # Just acknowledge
         admin_msg = await update.message.reply_text("Media received.")
         # Auto-delete confirmation after 5 seconds
-        asyncio.create_task(delete_message_after_delay(admin_msg, 5))
+        schedule_message_delete(admin_msg, 5)
         return
     
     # Check if user is authenticated and session is valid
-    if not bot_data.is_session_valid(user_id):
-        # Authentication expired or user not authenticated
-        if str(user_id) in bot_data.authenticated_users:
-            # Session expired, remove from authenticated users
-            del bot_data.authenticated_users[str(user_id)]
-            bot_data.save_to_file()
-            auth_error = await update.message.reply_text(
-                "Your session has expired. Please authenticate again with /start"
-            )
-            # Auto-delete after 10 seconds
-            asyncio.create_task(delete_message_after_delay(auth_error, 10))
-            
-            # Clear chat history after session expiry
-            await clear_chat_history(context, user_id)
-        else:
-            auth_required = await update.message.reply_text(
-                "You need to authenticate first. Please use /start command."
-            )
-            # Auto-delete after 10 seconds
-            asyncio.create_task(delete_message_after_delay(auth_required, 10))
+    session = bot_data.get_valid_session(user_id)
+    if session is None:
+        await _handle_unauthed(update, context, user_id)
         return
     
     # Update last activity timestamp for valid sessions
-    bot_data.update_activity(user_id)
+    bot_data.update_activity(user_id, session)
     
-    # Determine media type and relay to admin
+    # Read the clock once; reused for the group metadata timestamp
+    now = datetime.now()
+
+    # Determine media type and relay to admin via the dispatch table
     media_type = "Unknown"
     file_id = None
+    send_entry = None
     caption = update.message.caption or ""
-    
-    if update.message.photo:
-        media_type = "Photo"
-        file_id = update.message.photo[-1].file_id  # Get the largest photo
-    elif update.message.video:
-        media_type = "Video"
-        file_id = update.message.video.file_id
-    elif update.message.audio:
-        media_type = "Audio"
-        file_id = update.message.audio.file_id
-    elif update.message.voice:
-        media_type = "Voice"
-        file_id = update.message.voice.file_id
-    elif update.message.document:
-        media_type = "Document"
-        file_id = update.message.document.file_id
-    elif update.message.sticker:
-        media_type = "Sticker"
-        file_id = update.message.sticker.file_id
-    elif update.message.animation:
-        media_type = "Animation"
-        file_id = update.message.animation.file_id
-    elif update.message.video_note:
-        media_type = "Video Note"
-        file_id = update.message.video_note.file_id
+
+    for attr, label, method_name, kwarg_name, takes_caption in MEDIA_DISPATCH:
+        media_obj = getattr(update.message, attr)
+        if media_obj:
+            media_type = label
+            # Photos come as a list of sizes; relay the largest
+            file_id = media_obj[-1].file_id if attr == "photo" else media_obj.file_id
+            send_entry = (method_name, kwarg_name, takes_caption)
+            break
     
     # IMPORTANT: Save the original message before deleting it
     # This needs to happen before we delete the message
@@ -1382,71 +1657,45 @@ async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     try:
         await update.message.delete()
     except Exception as e:
-        logger.warning(f"Could not delete user media: {e}")
+        logger.warning("Could not delete user media: %s", e)
     
     # Forward media to admin
     try:
-        # Send media to admin (just the media, no header text)
-        admin_msg = None
-        if media_type == "Photo":
-            admin_msg = await context.bot.send_photo(chat_id=ADMIN_ID, photo=file_id, caption=caption)
-        elif media_type == "Video":
-            admin_msg = await context.bot.send_video(chat_id=ADMIN_ID, video=file_id, caption=caption)
-        elif media_type == "Audio":
-            admin_msg = await context.bot.send_audio(chat_id=ADMIN_ID, audio=file_id, caption=caption)
-        elif media_type == "Voice":
-            admin_msg = await context.bot.send_voice(chat_id=ADMIN_ID, voice=file_id, caption=caption)
-        elif media_type == "Document":
-            admin_msg = await context.bot.send_document(chat_id=ADMIN_ID, document=file_id, caption=caption)
-        elif media_type == "Sticker":
-            admin_msg = await context.bot.send_sticker(chat_id=ADMIN_ID, sticker=file_id)
-        elif media_type == "Animation":
-            admin_msg = await context.bot.send_animation(chat_id=ADMIN_ID, animation=file_id, caption=caption)
-        elif media_type == "Video Note":
-            admin_msg = await context.bot.send_video_note(chat_id=ADMIN_ID, video_note=file_id)
+        async def send_media(chat_id):
+            if send_entry is None:
+                # Forward unknown media types directly
+                return await original_message.forward(chat_id=chat_id)
+            method_name, kwarg_name, takes_caption = send_entry
+            kwargs = {"chat_id": chat_id, kwarg_name: file_id}
+            if takes_caption:
+                kwargs["caption"] = caption
+            return await getattr(context.bot, method_name)(**kwargs)
+
+        # Send the media to admin and the backup group concurrently;
+        # the group info message is sent afterwards since it only matters
+        # when both copies went through
+        if GROUP_ID:
+            admin_msg, group_media_msg = await asyncio.gather(
+                send_media(ADMIN_ID), send_media(GROUP_ID)
+            )
         else:
-            # Forward unknown media types directly
-            admin_msg = await original_message.forward(chat_id=ADMIN_ID)
-        
-        # Send detailed info AND the media to the backup group
-        if GROUP_ID and admin_msg:
-            # First send the media file to the group
+            admin_msg = await send_media(ADMIN_ID)
             group_media_msg = None
-            if media_type == "Photo":
-                group_media_msg = await context.bot.send_photo(chat_id=GROUP_ID, photo=file_id, caption=caption)
-            elif media_type == "Video":
-                group_media_msg = await context.bot.send_video(chat_id=GROUP_ID, video=file_id, caption=caption)
-            elif media_type == "Audio":
-                group_media_msg = await context.bot.send_audio(chat_id=GROUP_ID, audio=file_id, caption=caption)
-            elif media_type == "Voice":
-                group_media_msg = await context.bot.send_voice(chat_id=GROUP_ID, voice=file_id, caption=caption)
-            elif media_type == "Document":
-                group_media_msg = await context.bot.send_document(chat_id=GROUP_ID, document=file_id, caption=caption)
-            elif media_type == "Sticker":
-                group_media_msg = await context.bot.send_sticker(chat_id=GROUP_ID, sticker=file_id)
-            elif media_type == "Animation":
-                group_media_msg = await context.bot.send_animation(chat_id=GROUP_ID, animation=file_id, caption=caption)
-            elif media_type == "Video Note":
-                group_media_msg = await context.bot.send_video_note(chat_id=GROUP_ID, video_note=file_id)
-            else:
-                # Forward unknown media types directly
-                group_media_msg = await original_message.forward(chat_id=GROUP_ID)
-            
+        
+        # Send detailed info to the backup group
+        if group_media_msg and admin_msg:
             # Then send the info message with action buttons
-            group_info = (
-                f"📨 *{media_type} from {user_name}*\n"
-                f"👤 ID: `{user_id}`\n"
-                f"⏰ Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            group_info = GROUP_MEDIA_TEMPLATE.format(
+                media_type=media_type,
+                name=escape_markdown(user_name or ""),
+                user_id=user_id,
+                time=now.strftime('%Y-%m-%d %H:%M:%S')
             )
             if caption:
-                group_info += f"\n\n*Caption:* {caption}"
+                group_info += f"\n\n*Caption:* {escape_markdown(caption)}"
             
-            # Create action buttons for admin
-            keyboard = [
-                [InlineKeyboardButton("Reply to User", callback_data=f"reply_{user_id}")],
-                [InlineKeyboardButton("Block User", callback_data=f"block_{user_id}")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            # Cached action buttons for admin
+            reply_markup = _relay_markup(user_id)
             
             group_msg = await context.bot.send_message(
                 chat_id=GROUP_ID,
@@ -1455,13 +1704,9 @@ async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                 reply_markup=reply_markup
             )
             
-            # Store message mapping for /showme command
-            if not hasattr(context.bot_data, 'message_map'):
-                context.bot_data['message_map'] = {}
-            
             # Map the admin message ID to BOTH group messages 
             # (use the media message ID as primary for /showme)
-            context.bot_data['message_map'][str(admin_msg.message_id)] = {
+            context.bot_data['message_map'][admin_msg.message_id] = {
                 'chat_id': GROUP_ID,
                 'message_id': group_media_msg.message_id,  # Use the media message ID
                 'info_message_id': group_msg.message_id,   # Store the info message ID too
@@ -1469,6 +1714,9 @@ async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                 'sender_name': user_name,
                 'media_type': media_type
             }
+            message_map = context.bot_data['message_map']
+            while len(message_map) > MESSAGE_MAP_MAX:
+                message_map.popitem(last=False)
             
             # Send a single small note about /showme once per conversation
             if not context.user_data.get('showme_info_sent'):
@@ -1478,10 +1726,10 @@ async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                 )
                 context.user_data['showme_info_sent'] = True
                 # Delete this info after 10 seconds
-                asyncio.create_task(delete_message_after_delay(info_msg, 10))
+                schedule_message_delete(info_msg, 10)
     
     except Exception as e:
-        logger.error(f"Failed to relay media: {e}")
+        logger.error("Failed to relay media: %s", e)
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text="Failed to send media. Please try again later."
@@ -1495,48 +1743,117 @@ async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     )
     
     # Delete confirmation after a short delay
-    asyncio.create_task(delete_message_after_delay(confirm_msg, 3))
+    schedule_message_delete(confirm_msg, 3)
+
+async def session_expiry_sweeper() -> None:
+    """Evict expired sessions from one shared task instead of per-user timers.
+
+    The heap holds (expiry_ts, user_id) pairs; entries made stale by later
+    activity are simply re-queued with the fresh deadline when popped.
+    """
+    while True:
+        await asyncio.sleep(30)
+        now_ts = time.time()
+        heap = bot_data._expiry_heap
+        removed_any = False
+        while heap and heap[0][0] <= now_ts:
+            _, user_id = heapq.heappop(heap)
+            user_data = bot_data.authenticated_users.get(user_id)
+            if user_data is None:
+                continue
+            if bot_data.is_session_valid(user_id):
+                # Activity extended the session; re-queue with the new deadline
+                last_activity = user_data.get("last_activity", now_ts)
+                timeout_seconds = user_data.get("session_timeout", SESSION_TIMEOUT_SEC)
+                heapq.heappush(heap, (last_activity + timeout_seconds, user_id))
+                continue
+            bot_data.authenticated_users.pop(user_id, None)
+            bot_data._recipient_ids.discard(user_id)
+            removed_any = True
+            logger.info("Removed expired session for user %s", user_id)
+        if removed_any:
+            await bot_data.save_to_file_async()
+
+async def activity_checkpoint_loop() -> None:
+    """Periodically fold the activity log into the main data file."""
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        await bot_data.checkpoint()
 
-async def delete_message_after_delay(message, delay_seconds):
-    """Delete a message after a specified delay."""
+# Cap on retained /showme message-map entries; oldest are evicted first
+MESSAGE_MAP_MAX = 10_000
+
+# Plain text messages that aren't commands; shared by the auth conversation
+# state and the global relay handler
+NON_COMMAND_TEXT = filters.TEXT & ~filters.COMMAND
+
+# Pending auto-delete messages as (due_ts, chat_id, message_id); a single
+# worker drains this instead of one sleeping task per message
+_pending_deletes: List[tuple] = []
+
+def schedule_message_delete(message, delay_seconds) -> None:
+    """Queue a message for deletion after the specified delay."""
     if not message:
         logger.warning("Attempted to delete a null message")
         return
     
     try:
-        # Verify the message has a chat_id and message_id
-        _ = message.chat_id
-        _ = message.message_id
+        heapq.heappush(_pending_deletes, (time.time() + delay_seconds, message.chat_id, message.message_id))
     except AttributeError:
         logger.warning("Attempted to delete an invalid message object")
-        return
-    
-    await asyncio.sleep(delay_seconds)
-    
+
+async def _delete_one(bot, chat_id: int, message_id: int) -> None:
+    """Delete a single queued message, ignoring the usual benign failures."""
     try:
-        await message.delete()
+        await send_bucket.acquire()
+        await bot.delete_message(chat_id=chat_id, message_id=message_id)
     except Exception as e:
         # Don't log common errors like "message to delete not found"
         if "message to delete not found" not in str(e).lower() and "message can't be deleted" not in str(e).lower():
-            logger.warning(f"Could not delete message: {e}")
-            
+            logger.warning("Could not delete message: %s", e)
+
+async def message_delete_worker(bot) -> None:
+    """Drain due auto-delete entries in batches."""
+    while True:
+        try:
+            await asyncio.sleep(1)
+            now_ts = time.time()
+            due = []
+            while _pending_deletes and _pending_deletes[0][0] <= now_ts:
+                _, chat_id, message_id = heapq.heappop(_pending_deletes)
+                due.append((chat_id, message_id))
+            if due:
+                await asyncio.gather(
+                    *(_delete_one(bot, chat_id, message_id) for chat_id, message_id in due),
+                    return_exceptions=True
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Error in message delete worker: %s", e)
+
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Log errors caused by updates."""
-    logger.error(f"Update {update} caused error: {context.error}")
+    logger.error("Update %s caused error: %s", update, context.error)
     
     # Notify admin of errors
     if ADMIN_ID:
-        error_message = f"⚠️ *ERROR ALERT*\n\n"
+        parts = ["⚠️ *ERROR ALERT*\n\n"]
         
+        # Escape dynamic fields: user-supplied text with stray Markdown
+        # characters would otherwise make the notification itself fail
         if update:
             if update.effective_user:
-                error_message += f"User: {update.effective_user.first_name} (ID: {update.effective_user.id})\n"
+                parts.append(f"User: {escape_markdown(update.effective_user.first_name or '')} (ID: {update.effective_user.id})\n")
             if update.effective_chat:
-                error_message += f"Chat: {update.effective_chat.title} (ID: {update.effective_chat.id})\n"
+                parts.append(f"Chat: {escape_markdown(update.effective_chat.title or '')} (ID: {update.effective_chat.id})\n")
             if update.effective_message:
-                error_message += f"Message: {update.effective_message.text if update.effective_message.text else '[No text]'}\n"
+                message_text = update.effective_message.text or '[No text]'
+                parts.append(f"Message: {escape_markdown(message_text)}\n")
         
-        error_message += f"\nError: {context.error}"
+        parts.append(f"\nError: {escape_markdown(str(context.error))}")
+        error_message = "".join(parts)
         
         try:
             await context.bot.send_message(
@@ -1545,86 +1862,161 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                 parse_mode=ParseMode.MARKDOWN
             )
         except Exception as e:
-            logger.error(f"Failed to send error notification: {e}")
+            logger.error("Failed to send error notification: %s", e)
+
+# Command menus registered with Telegram; static, so built once at import
+USER_BOT_COMMANDS = [
+    BotCommand("start", "Start the bot and authenticate"),
+    BotCommand("status", "Check your authentication status"),
+    BotCommand("help", "Show help information")
+]
+
+ADMIN_BOT_COMMANDS = [
+    BotCommand("start", "Start the bot and authenticate"),
+    BotCommand("help", "Show help information"),
+    BotCommand("status", "Check system status and active sessions"),
+    BotCommand("cmd", "Show command list"),
+    BotCommand("setupgroup", "Set current group as backup group"),
+    BotCommand("broadcast", "Send message to all users"),
+    BotCommand("block", "Block a user from using the bot"),
+    BotCommand("unblock", "Unblock a previously blocked user"),
+    BotCommand("users", "List all authenticated users"),
+    BotCommand("setquestion", "Set security question and answer"),
+    BotCommand("showme", "See full message details when replying"),
+    BotCommand("clearall", "Clear all authenticated users")
+]
 
 async def register_bot_commands(application: Application) -> None:
     """Register bot commands with Telegram to show in the command menu."""
-    # Define commands for regular users
-    user_commands = [
-        ("start", "Start the bot and authenticate"),
-        ("status", "Check your authentication status"),
-        ("help", "Show help information")
-    ]
-    
-    # Define commands for admin
-    admin_commands = [
-        ("start", "Start the bot and authenticate"),
-        ("help", "Show help information"),
-        ("status", "Check system status and active sessions"),
-        ("cmd", "Show command list"),
-        ("setupgroup", "Set current group as backup group"),
-        ("broadcast", "Send message to all users"),
-        ("block", "Block a user from using the bot"),
-        ("unblock", "Unblock a previously blocked user"),
-        ("users", "List all authenticated users"),
-        ("setquestion", "Set security question and answer"),
-        ("showme", "See full message details when replying"),
-        ("clearall", "Clear all authenticated users")
-    ]
-    
-    # Set commands for regular users (visible in private chats)
-    await application.bot.set_my_commands(
-        [BotCommand(command, description) for command, description in user_commands],
-        scope=BotCommandScopeAllPrivateChats()
-    )
-    
-    # Set commands for admin (visible only to admin)
-    if ADMIN_ID:
-        await application.bot.set_my_commands(
-            [BotCommand(command, description) for command, description in admin_commands],
-            scope=BotCommandScopeChat(chat_id=ADMIN_ID)
-        )
-    
-    logger.info("Bot commands registered")
+    # Create the admin-message -> group-message map once at startup so the
+    # relay handlers never have to existence-check it
+    application.bot_data.setdefault('message_map', OrderedDict())
+
+    # The command menus only change when the code does, so hash them and
+    # skip the two registration calls when nothing changed since last start
+    digest = hashlib.sha256(repr(
+        [(c.command, c.description) for c in USER_BOT_COMMANDS + ADMIN_BOT_COMMANDS]
+        + [ADMIN_ID]
+    ).encode()).hexdigest()
+    try:
+        with open(COMMANDS_HASH_FILE, "r") as f:
+            unchanged = f.read().strip() == digest
+    except OSError:
+        unchanged = False
+
+    if unchanged:
+        logger.info("Bot commands unchanged, skipping registration")
+    else:
+        # The user and admin menus are independent scopes, so register
+        # them concurrently instead of paying two sequential round-trips
+        registrations = [
+            application.bot.set_my_commands(
+                USER_BOT_COMMANDS,
+                scope=BotCommandScopeAllPrivateChats()
+            )
+        ]
+        if ADMIN_ID:
+            registrations.append(
+                application.bot.set_my_commands(
+                    ADMIN_BOT_COMMANDS,
+                    scope=BotCommandScopeChat(chat_id=ADMIN_ID)
+                )
+            )
+        await asyncio.gather(*registrations)
+
+        try:
+            with open(COMMANDS_HASH_FILE, "w") as f:
+                f.write(digest)
+        except OSError as e:
+            logger.warning("Could not persist command hash: %s", e)
+
+        logger.info("Bot commands registered")
+
+    # Start the periodic checkpoint of the activity log, the session
+    # sweeper and the shared auto-delete worker
+    application.create_task(activity_checkpoint_loop())
+    application.create_task(session_expiry_sweeper())
+    application.create_task(message_delete_worker(application.bot))
+
+# Conversation handler for authentication with proper states
+CONV_HANDLER = ConversationHandler(
+    entry_points=[CommandHandler("start", start)],
+    states={
+        AWAITING_AUTH_REPLY: [MessageHandler(NON_COMMAND_TEXT, authenticate)],
+        SESSION_SELECTION: [CallbackQueryHandler(session_selection, pattern=CB_SESSION_RE)],
+    },
+    fallbacks=[CommandHandler("start", start)],
+    per_chat=True, # Use per_chat instead of per_message to avoid warnings and ensure correct function
+    name="auth_conversation",
+    persistent=True,
+)
+
+# Media handler filter, limited to the media types the relay understands
+# so service messages (joins, pins, migrations) never schedule it
+MEDIA_FILTER = (
+    filters.PHOTO | filters.VIDEO | filters.AUDIO | filters.VOICE
+    | filters.Document.ALL | filters.Sticker.ALL | filters.ANIMATION
+    | filters.VIDEO_NOTE
+)
+
+# The full dispatch table, in order; built once at import so restarts of
+# main() reuse the same handler objects. The callback handlers are
+# narrow and pattern-matched, so PTB compiles each pattern once and
+# dispatches without a linear scan.
+BOT_HANDLERS = [
+    CONV_HANDLER,
+    CallbackQueryHandler(_cb_auth, pattern=CB_AUTH_RE),
+    CallbackQueryHandler(_cb_session_wait, pattern=CB_SESSION_RE),
+    CallbackQueryHandler(_cb_reply, pattern=CB_REPLY_RE),
+    CallbackQueryHandler(_cb_block, pattern=CB_BLOCK_RE),
+    CallbackQueryHandler(_cb_terminate, pattern=CB_TERMINATE_RE),
+    CallbackQueryHandler(_cb_showme, pattern=CB_SHOWME_RE),
+    CallbackQueryHandler(_cb_confirm_clearall, pattern=CB_CONFIRM_CLEARALL_RE),
+    CallbackQueryHandler(_cb_cancel_clearall, pattern=CB_CANCEL_CLEARALL_RE),
+    CommandHandler("help", help_command),
+    CommandHandler("cmd", cmd_command),
+    CommandHandler("status", status_command),
+    CommandHandler("setupgroup", setup_group),
+    CommandHandler("broadcast", broadcast_command),
+    CommandHandler("block", block_user),
+    CommandHandler("unblock", unblock_user),
+    CommandHandler("users", list_users),
+    CommandHandler("setquestion", set_security_question),
+    CommandHandler("showme", showme_command),
+    CommandHandler("clearall", clearall_command),
+    MessageHandler(NON_COMMAND_TEXT, relay_message),
+    MessageHandler(MEDIA_FILTER, handle_media),
+]
 
 def main() -> None:
     """Start the bot."""
-    # Create the Application
-    application = Application.builder().token(BOT_TOKEN).build()
-    
-    # Add conversation handler for authentication with proper states
-    conv_handler = ConversationHandler(
-        entry_points=[CommandHandler("start", start)],
-        states={
-            AWAITING_AUTH_REPLY: [MessageHandler(filters.TEXT & ~filters.COMMAND, authenticate)],
-            SESSION_SELECTION: [CallbackQueryHandler(session_selection, pattern="^session_")],
-        },
-        fallbacks=[CommandHandler("start", start)],
-        per_chat=True, # Use per_chat instead of per_message to avoid warnings and ensure correct function
+    # Swap in uvloop's event loop policy before PTB creates the loop
+    if HAS_UVLOOP:
+        uvloop.install()
+        logger.info("Using uvloop event loop")
+
+    # Create the Application with an HTTP pool sized for concurrent
+    # fan-out (broadcast, clearall, parallel media sends) so requests
+    # don't queue behind a handful of connections; updates are processed
+    # concurrently with a bound, and PTB's rate limiter keeps the total
+    # send rate under Telegram's ~30 msg/s global limit
+    # Conversation state survives restarts, so a deploy doesn't force
+    # every mid-auth user back to /start; writes are batched to disk
+    persistence = PicklePersistence(filepath=PERSISTENCE_FILE, update_interval=60)
+
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(REQUEST_CLASS(connection_pool_size=64, pool_timeout=30.0))
+        .get_updates_request(REQUEST_CLASS(connection_pool_size=16))
+        .concurrent_updates(256)
+        .rate_limiter(AIORateLimiter(overall_max_rate=28, max_retries=3))
+        .persistence(persistence)
+        .build()
     )
-    application.add_handler(conv_handler)
-    
-    # Add button callback handler for all button actions
-    application.add_handler(CallbackQueryHandler(button_callback))
-    
-    # Add command handlers
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("cmd", cmd_command))
-    application.add_handler(CommandHandler("status", status_command))
-    application.add_handler(CommandHandler("setupgroup", setup_group))
-    application.add_handler(CommandHandler("broadcast", broadcast_command))
-    application.add_handler(CommandHandler("block", block_user))
-    application.add_handler(CommandHandler("unblock", unblock_user))
-    application.add_handler(CommandHandler("users", list_users))
-    application.add_handler(CommandHandler("setquestion", set_security_question))
-    application.add_handler(CommandHandler("showme", showme_command))
-    application.add_handler(CommandHandler("clearall", clearall_command))
-    
-    # Message handlers
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, relay_message))
-    
-    # Media handler for all non-text messages
-    application.add_handler(MessageHandler(~filters.TEXT, handle_media))
+    
+    # Register the pre-built dispatch table in one batch
+    application.add_handlers(BOT_HANDLERS)
     
     # Add error handler
     application.add_error_handler(error_handler)
@@ -1632,20 +2024,47 @@ def main() -> None:
     # Register bot commands on startup
     application.post_init = register_bot_commands
     
-    # Determine if running on Railway
-    if RAILWAY_STATIC_URL:
-        # Set webhook for Railway deployment
-        webhook_url = f"{RAILWAY_STATIC_URL}/{BOT_TOKEN}"
+    # Prefer webhook mode whenever a public URL is available: Telegram
+    # pushes updates instead of the bot holding a getUpdates long-poll
+    # open around the clock
+    # The handlers only consume plain messages and callback queries, so
+    # ask Telegram not to deliver the other update categories at all
+    allowed_updates = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+    # Discard the queued backlog after downtime by default so a deploy
+    # doesn't replay hours of stale updates before serving live traffic;
+    # set DROP_PENDING=0 to process the backlog instead
+    drop_pending = os.getenv("DROP_PENDING", "1") == "1"
+
+    public_url = RAILWAY_STATIC_URL or os.getenv("WEBHOOK_URL")
+    if public_url:
+        # Use a hash of the token as the URL path so the raw token never
+        # shows up in proxy/access logs, and authenticate deliveries with
+        # Telegram's secret-token header instead
+        url_path = hashlib.blake2s(BOT_TOKEN.encode(), digest_size=16).hexdigest()
+        secret_token = os.getenv("WEBHOOK_SECRET") or hashlib.blake2s(
+            f"secret:{BOT_TOKEN}".encode(), digest_size=16
+        ).hexdigest()
+        webhook_url = f"{public_url}/{url_path}"
         application.run_webhook(
             listen="0.0.0.0",
             port=PORT,
-            url_path=BOT_TOKEN,
-            webhook_url=webhook_url
+            url_path=url_path,
+            webhook_url=webhook_url,
+            secret_token=secret_token,
+            drop_pending_updates=drop_pending,
+            allowed_updates=allowed_updates
         )
-        logger.info(f"Bot running in webhook mode on Railway.app at port {PORT}")
+        logger.info("Bot running in webhook mode at port %s", PORT)
     else:
         # Run the bot locally in polling mode
-        application.run_polling()
+        application.run_polling(
+            poll_interval=0.0,
+            timeout=50,
+            bootstrap_retries=-1,
+            drop_pending_updates=drop_pending,
+            allowed_updates=allowed_updates
+        )
         logger.info("Bot running in polling mode")
 
 if __name__ == "__main__":
@@ -0,0 +1,38 @@
+"""Regression test for the AsyncTokenBucket send limiter."""
+import asyncio
+import time
+
+from main import AsyncTokenBucket
+
+RATE = 50
+CALLS = 150
+
+
+def test_token_bucket_sustained_rate():
+    """Sustained throughput must stay at the configured rate.
+
+    A refill-accounting bug once credited the sleep interval twice,
+    doubling the effective rate and blowing Telegram's ~30 msg/s cap.
+    """
+    async def drain() -> float:
+        bucket = AsyncTokenBucket(rate=RATE)
+        start = time.monotonic()
+        for _ in range(CALLS):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(drain())
+    # The first RATE acquires are the free initial burst; the rest must
+    # be paced at the configured rate
+    sustained = (CALLS - RATE) / elapsed
+    assert sustained <= RATE * 1.1, (
+        f"bucket leaks tokens: {sustained:.1f} ops/s sustained, limit {RATE}"
+    )
+    assert sustained >= RATE * 0.5, (
+        f"bucket overly strict: {sustained:.1f} ops/s sustained, limit {RATE}"
+    )
+
+
+if __name__ == "__main__":
+    test_token_bucket_sustained_rate()
+    print("ok")